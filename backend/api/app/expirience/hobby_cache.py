@@ -0,0 +1,99 @@
+import asyncio
+import hashlib
+import time
+from typing import Optional
+from uuid import uuid4
+
+from common.core.config import settings
+from common.schemas.hobbies import HobbyList
+from common.storage import rabbit
+from logger import logger
+
+
+class HobbyCatalogCache:
+    """
+    Готовое тело ответа GET /hobbies/ с ETag.
+    Сбрасывается по рассылке HOBBIES_EXCHANGE после create_hobby,
+    ttl страхует от пропущенных рассылок
+    """
+
+    def __init__(self, ttl: float = settings.HOBBY_CACHE_TTL):
+        self.ttl = ttl
+        self.body: Optional[bytes] = None
+        self.etag: Optional[str] = None
+        self._loaded_at = 0.0
+        self._version = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._listen())
+
+    async def _listen(self, max_delay: float = 30):
+        """Держит подписку на HOBBIES_EXCHANGE и переподключается с нарастающей паузой"""
+        delay = 1.0
+        while True:
+            started = time.monotonic()
+            try:
+                await rabbit.subscribe(settings.HOBBIES_EXCHANGE, self._on_event)
+                logger.warning(f'Subscription to {settings.HOBBIES_EXCHANGE} ended, resubscribing in {delay:.0f}s')
+            except Exception:
+                logger.exception(f'Subscription to {settings.HOBBIES_EXCHANGE} failed, retrying in {delay:.0f}s')
+
+            # Пока подписки не было, рассылки могли потеряться
+            self.invalidate()
+            if time.monotonic() - started > max_delay:
+                delay = 1.0
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _on_event(self, body: dict):
+        if body.get('action') == 'hobbies_changed':
+            self.invalidate()
+
+    def invalidate(self):
+        self._version += 1
+        self.body = self.etag = None
+
+    def _fresh(self) -> bool:
+        return self.body is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def get(self) -> tuple[bytes, str]:
+        """Возвращает (тело, etag), при промахе один раз загружает каталог через pg_consumer"""
+        if self._fresh():
+            self.hits += 1
+            return self.body, self.etag
+
+        async with self._lock:
+            if self._fresh():
+                self.hits += 1
+                return self.body, self.etag
+
+            self.misses += 1
+            version = self._version
+            user_id = str(uuid4())
+            answer = await rabbit.send_message({'user_id': user_id, 'action': 'get_hobbies'}, settings.DB_QUEUE, 'hobbies', user_id, wait_answer=True)
+            # Ответ pg_consumer - уже сериализованный HobbyList, проверяем его и отдаём как есть
+            HobbyList.model_validate_json(answer)
+
+            body, etag = answer, f'"{hashlib.sha256(answer).hexdigest()[:32]}"'
+            # Если каталог сбросили, пока шёл запрос, результат мог устареть - не кэшируем
+            if version == self._version:
+                self.body, self.etag, self._loaded_at = body, etag, time.monotonic()
+            else:
+                logger.info('Hobby catalog changed while loading, skipping cache')
+            return body, etag
+
+    def stats(self) -> dict:
+        return {'cached': self.body is not None, 'hits': self.hits, 'misses': self.misses}
+
+
+hobby_cache = HobbyCatalogCache()
@@ -0,0 +1,77 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import BinaryIO, Optional
+
+from fastapi import UploadFile
+
+from common.core.config import settings
+from common.storage.minio_util import object_exists, upload_image
+from app.expirience.thumbnails import VARIANTS, VARIANT_CONTENT_TYPE, render_variants
+
+
+IMAGE_VARIANTS = ('original', *VARIANTS)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def image_key(digest: str, variant: str) -> str:
+    """Ключи определяются содержимым, поэтому одинаковые загрузки попадают в одни и те же объекты"""
+    return f'images/{digest}/{variant}'
+
+
+def _spool(source: BinaryIO, target: BinaryIO, chunk_size: int = 1024 * 1024) -> tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := source.read(chunk_size):
+        digest.update(chunk)
+        target.write(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+async def ingest_image(file: UploadFile) -> str:
+    """
+    Сохраняет оригинал и его варианты в MinIO и возвращает sha256 содержимого.
+    Повторная загрузка того же файла ничего не пересчитывает
+    """
+    fd, path = tempfile.mkstemp(prefix='hobby-')
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            digest, size = await asyncio.to_thread(_spool, file.file, target)
+
+        original_key = image_key(digest, 'original')
+        if await object_exists(original_key):
+            return digest
+
+        content_type, variants = await asyncio.get_running_loop().run_in_executor(_get_pool(), render_variants, path)
+        # upload_image бросает исключение при ошибке, и до оригинала дело не доходит
+        for name, data in variants.items():
+            await upload_image(image_key(digest, name), BytesIO(data), length=len(data), content_type=VARIANT_CONTENT_TYPE)
+
+        # Оригинал загружаем последним и только после всех вариантов: если он есть, то и варианты на месте.
+        # Content type берётся из разобранного формата, а не от клиента: оригинал раздаётся публично
+        with open(path, 'rb') as source:
+            await upload_image(original_key, source, length=size, content_type=content_type)
+
+        return digest
+    finally:
+        await asyncio.to_thread(os.remove, path)
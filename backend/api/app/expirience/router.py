@@ -1,26 +1,41 @@
-from fastapi import APIRouter, Depends, Form, UploadFile, File
-from common.schemas.hobbies import HobbySchema, HobbyCreate, HobbyList
+from fastapi import APIRouter, Depends, Form, UploadFile, File, Request, Response
+from fastapi.responses import StreamingResponse
+from common.schemas.hobbies import HobbySchema, HobbyCreate
 from common.schemas.user import UserInfo
 from common.storage.rabbit import send_message
 from uuid import uuid4
 from app.utils import get_user_id
 from pydantic.types import PastDate
 from common.core.config import settings
-from common.storage.minio_util import upload_image
+from common.storage.minio_util import ensure_bucket, stream_image
+from common.storage.vector_cache import user_vector_cache
+from app.expirience.hobby_cache import hobby_cache
+from app.expirience import images
 
 router = APIRouter()
 
 
+@router.on_event('startup')
+async def on_startup():
+    await ensure_bucket()
+    await hobby_cache.start()
+
+@router.on_event('shutdown')
+async def on_shutdown():
+    await hobby_cache.stop()
+    images.shutdown()
+
+
 @router.post("/hobbies/")
 async def create_hobby(
     hobby: HobbyCreate,
     file: UploadFile = File(...)
 ) -> HobbySchema | dict:
     
-    contents = await file.read()  # читаем содержимое файла в bytes
-    await upload_image(file.filename, contents)
-
-    hobby.image = file.filename
+    try:
+        hobby.image = await images.ingest_image(file)
+    except Exception as exc:
+        return {'Error': 'Не удалось обработать изображение'}
 
     user_id = str(uuid4())
     body = {'user_id': user_id, 'action': 'create_hobby', 'new_hobby': hobby.model_dump()}
@@ -28,24 +43,58 @@ async def create_hobby(
     try:
         answer = await send_message(body, settings.DB_QUEUE, 'hobbies', user_id, wait_answer=True)
         info: HobbySchema = HobbySchema.model_validate_json(answer)
+        hobby_cache.invalidate()
         return info
     except Exception as exc:
         return {'Error': 'Попробуйте позже, ме ещё не подключили базу данных)))'}
 
 
-@router.get("/hobbies/")
-async def read_hobbies() -> HobbyList | dict:
-
-    user_id = str(uuid4())
-    body = {'user_id': user_id, 'action': 'get_hobbies'}
+@router.get("/hobbies/", response_model=None)
+async def read_hobbies(request: Request) -> Response | dict:
 
     try:
-        answer = await send_message(body, settings.DB_QUEUE, 'hobbies', user_id, wait_answer=True)
-        info: HobbyList = HobbyList.model_validate_json(answer)
-        return info
+        body, etag = await hobby_cache.get()
     except Exception as exc:
         return {'Error': 'Попробуйте позже, ме ещё не подключили базу данных)))'}
 
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if_none_match = request.headers.get('If-None-Match', '')
+    if etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(',')):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type='application/json', headers=headers)
+
+
+@router.get("/hobbies/stats")
+async def hobbies_stats():
+    return {'catalog': hobby_cache.stats()}
+
+
+@router.get("/hobbies/images/{digest}/{variant}")
+async def read_hobby_image_variant(digest: str, variant: str):
+    if variant not in images.IMAGE_VARIANTS:
+        return Response(status_code=404)
+
+    image = await stream_image(images.image_key(digest, variant))
+    if image is None:
+        return Response(status_code=404)
+
+    chunks, headers = image
+    # Ключ определяется содержимым, значит объект по нему никогда не меняется
+    headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    headers['X-Content-Type-Options'] = 'nosniff'
+    return StreamingResponse(chunks, media_type=headers.pop('Content-Type', None), headers=headers)
+
+
+@router.get("/hobbies/images/{filename}")
+async def read_hobby_image(filename: str):
+    image = await stream_image(filename)
+    if image is None:
+        return Response(status_code=404)
+
+    chunks, headers = image
+    return StreamingResponse(chunks, media_type=headers.pop('Content-Type', None), headers=headers)
+
 
 @router.get("/user/")
 async def get_userdata(user_id: str = Depends(get_user_id)) -> UserInfo | dict:
@@ -80,6 +129,8 @@ async def update_userdata(username: str = Form(...),
 
     info.birthdate = info.birthdate.isoformat()
 
+    # Новый вектор запишет data_processor, старый больше не нужен
+    await user_vector_cache.invalidate(user_id)
 
     await send_message(
         msg={'user_id': user_id, 'action': 'update_user', 'description': description},
@@ -0,0 +1,34 @@
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+
+# Варианты изображения: имя -> ограничивающий прямоугольник
+VARIANTS = {
+    'thumb': (160, 160),
+    'card': (480, 480),
+}
+VARIANT_FORMAT = 'WEBP'
+VARIANT_CONTENT_TYPE = 'image/webp'
+
+
+def render_variants(path: str) -> tuple[str, dict[str, bytes]]:
+    """
+    Строит уменьшенные варианты изображения; выполняется в пуле процессов.
+    Возвращает и content type оригинала по формату, который определил Pillow
+    """
+    with Image.open(path) as image:
+        content_type = Image.MIME.get(image.format, 'application/octet-stream')
+        # JPEG можно декодировать сразу в уменьшенном масштабе
+        image.draft('RGB', max(VARIANTS.values()))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+        variants = {}
+        for name, size in VARIANTS.items():
+            variant = image.copy()
+            variant.thumbnail(size, Image.LANCZOS)
+            buffer = BytesIO()
+            variant.save(buffer, VARIANT_FORMAT, quality=85, method=4)
+            variants[name] = buffer.getvalue()
+        return content_type, variants
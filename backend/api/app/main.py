@@ -10,6 +10,7 @@ from app.rooms.router import router as rooms_router
 
 from app.utils import verify_token
 from common.core.config import settings
+from common.storage.rabbit import rpc_client
 
 app = FastAPI()
 
@@ -18,6 +19,11 @@ app.include_router(hobbies_router, prefix="/api")
 app.include_router(rooms_router, prefix='/room')
 
 
+@app.on_event('shutdown')
+async def on_shutdown():
+    await rpc_client.close()
+
+
 @app.middleware('http')
 async def security_middleware(request: Request, handler: Callable):
     # try:
@@ -28,7 +34,10 @@ async def security_middleware(request: Request, handler: Callable):
             '/auth/register',
             '/api/hobbies',
         ]
-        if request.url.path in public_paths:
+        public_prefixes = (
+            '/api/hobbies/images/',
+        )
+        if request.url.path in public_paths or request.url.path.startswith(public_prefixes):
             return await handler(request)
 
         token = request.cookies.get(settings.COOKIE_NAME)
@@ -0,0 +1,200 @@
+import json
+from typing import Awaitable, Callable, Optional
+
+from aiortc import RTCPeerConnection, RTCSessionDescription, MediaStreamTrack
+from aiortc.contrib.media import MediaRelay
+
+from app.rooms.sessions import SessionRegistry
+from logger import logger
+
+
+RoomClosedCallback = Callable[[str], Awaitable[None]]
+
+
+class RoomRelay:
+    """
+    Один MediaRelay на комнату: каждый входящий трек читается один раз
+    и раздаётся всем подписчикам через прокси-треки
+    """
+
+    def __init__(self):
+        self.relay = MediaRelay()
+        # исходный трек -> {подключение-подписчик: прокси-трек}
+        self.subscribers: dict[MediaStreamTrack, dict[RTCPeerConnection, MediaStreamTrack]] = {}
+
+    def subscribe(self, track: MediaStreamTrack, pc: RTCPeerConnection) -> MediaStreamTrack:
+        proxies = self.subscribers.setdefault(track, {})
+        proxy = proxies.get(pc)
+        if proxy is None:
+            proxy = proxies[pc] = self.relay.subscribe(track)
+        return proxy
+
+    def remove_source(self, track: MediaStreamTrack):
+        for proxy in self.subscribers.pop(track, {}).values():
+            proxy.stop()
+
+    def close(self):
+        for track in list(self.subscribers):
+            self.remove_source(track)
+
+    def stats(self) -> dict:
+        return {
+            'sources': len(self.subscribers),
+            # MediaRelay читает исходный трек, пока у него есть хотя бы один живой прокси
+            'readers': sum(
+                1 for proxies in self.subscribers.values()
+                if any(proxy.readyState == 'live' for proxy in proxies.values())
+            ),
+            'subscribers': sum(len(proxies) for proxies in self.subscribers.values()),
+        }
+
+
+class MediaServer:
+    """
+    Комнаты и их RTCPeerConnection'ы в одном процессе.
+    Работает прямо в процессе API или внутри медиа-воркера
+    """
+
+    def __init__(self, on_room_closed: Optional[RoomClosedCallback] = None):
+        self.sessions = SessionRegistry()
+        self.relays: dict[str, RoomRelay] = {}
+        self.on_room_closed = on_room_closed
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        for room_id in list(self.sessions.room_ids()):
+            self.relays.pop(room_id).close()
+            for session in self.sessions.pop_room(room_id):
+                await session.pc.close()
+
+    def has_room(self, room_id: str) -> bool:
+        return self.sessions.has_room(room_id)
+
+    async def create_room(self, room_id: str):
+        self.sessions.create_room(room_id)
+        self.relays.setdefault(room_id, RoomRelay())
+
+    async def send_user_list(self, room_id: str):
+        """Отправляет список пользователей в комнате всем участникам."""
+        members = self.sessions.members(room_id)
+        message = json.dumps({
+            'action': 'users',
+            'users': [session.peer_id for session in members]
+        })
+        for session in members:
+            session.send(message)
+
+    async def connect(self, room_id: str) -> Optional[dict]:
+        """Создаёт подключение нового клиента к комнате и возвращает SDP-offer"""
+        if not self.sessions.has_room(room_id):
+            return None
+
+        relay = self.relays[room_id]
+        pc = RTCPeerConnection()
+        data_channel = pc.createDataChannel('renegotiation')
+        session = self.sessions.add(room_id, pc, data_channel)
+
+        @data_channel.on("open")
+        async def on_open():
+            # Трек собеседника мог прийти до открытия канала, и запрос на пересогласование потерялся
+            if any(
+                transceiver.sender.track is not None and transceiver.currentDirection in (None, 'recvonly', 'inactive')
+                for transceiver in pc.getTransceivers()
+            ):
+                data_channel.send(json.dumps({'action': 'renegotiating'}))
+            await self.send_user_list(room_id)
+
+        @data_channel.on('message')
+        async def on_message(message):
+            if message == 'keepalive':
+                data_channel.send('keepalive')
+                return
+
+            offerData = json.loads(message)
+            await pc.setRemoteDescription(RTCSessionDescription(sdp=offerData['sdp'], type=offerData['type']))
+            answer = await pc.createAnswer()
+            await pc.setLocalDescription(answer)
+            data_channel.send(
+                json.dumps({
+                    'action': 'answer',
+                    'sdp': pc.localDescription.sdp,
+                    'type': pc.localDescription.type,
+                })
+            )
+
+        # pc.addTransceiver('audio', 'recvonly')
+        pc.addTransceiver('video', 'recvonly')
+
+        for other in self.sessions.members(room_id):
+            if other is not session:
+                for track in other.tracks:
+                    pc.addTransceiver(relay.subscribe(track, pc), 'sendonly')
+
+        @pc.on('iceconnectionstatechange')
+        async def on_iceconnectionstatechange():
+            if pc.iceConnectionState in ('failed', 'disconnected', 'closed'):
+                logger.info(f'Client {session.peer_id} disconnected')
+
+                await self.remove_client(pc)
+
+        @pc.on('track')
+        async def on_track(track):
+            if track.kind not in ('video'):
+                return
+
+            session.tracks.add(track)
+            track.on('ended', lambda: relay.remove_source(track))
+
+            for other in self.sessions.members(room_id):
+                if other is not session:
+                    other.pc.addTrack(relay.subscribe(track, other.pc))
+                    other.send(json.dumps({'action': 'renegotiating'}))
+
+        offer = await pc.createOffer()
+        await pc.setLocalDescription(offer)
+
+        return {
+            'sdp': pc.localDescription.sdp,
+            'type': pc.localDescription.type,
+            'id': session.peer_id,
+            'room_id': room_id
+        }
+
+    async def answer(self, room_id: str, client_id: str, sdp: str, type: str) -> bool:
+        """Применяет SDP-answer клиента, False - если подключение не найдено"""
+        session = self.sessions.get(room_id, client_id)
+        if session is None:
+            return False
+
+        await session.pc.setRemoteDescription(RTCSessionDescription(sdp=sdp, type=type))
+        logger.info(f'Client {client_id} connected to room {room_id}')
+        await self.send_user_list(room_id)
+        return True
+
+    async def remove_client(self, pc: RTCPeerConnection):
+        """Уход любого участника закрывает всю комнату"""
+        session = self.sessions.by_pc(pc)
+        if session is not None:
+            room_id = session.room_id
+            self.relays.pop(room_id).close()
+
+            for other in self.sessions.pop_room(room_id):
+                if other is not session:
+                    await other.pc.close()
+
+            if self.on_room_closed is not None:
+                await self.on_room_closed(room_id)
+
+        await pc.close()
+
+    async def stats(self) -> dict:
+        return {
+            'workers': 0,
+            'peers': len(self.sessions),
+            'rooms': {
+                room_id: {'peers': len(self.sessions.members(room_id)), **self.relays[room_id].stats()}
+                for room_id in self.sessions.room_ids()
+            },
+        }
@@ -0,0 +1,141 @@
+import asyncio
+from typing import Optional
+
+from common.core.config import settings
+from common.storage.redis import RedisManager
+from logger import logger
+
+
+class LocalRoomRegistry:
+    """Реестр комнат в памяти процесса: годится, пока API работает в одном процессе"""
+
+    def __init__(self, node_id: str = settings.NODE_ID, node_url: str = settings.node_url):
+        self.node_id = node_id
+        self.node_url = node_url
+        self._rooms: set[str] = set()
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        self._rooms.clear()
+
+    async def register(self, room_id: str):
+        self._rooms.add(room_id)
+
+    async def unregister(self, room_id: str):
+        self._rooms.discard(room_id)
+
+    async def owner(self, room_id: str) -> Optional[str]:
+        return self.node_id if room_id in self._rooms else None
+
+    async def is_alive(self, room_id: str) -> bool:
+        return await self.owner(room_id) is not None
+
+    async def get_node_url(self, node_id: str) -> Optional[str]:
+        return self.node_url if node_id == self.node_id else None
+
+
+class RedisRoomRegistry(LocalRoomRegistry):
+    """
+    Общий реестр комнат в Redis: room:{room_id} -> id узла-владельца.
+    Записи живут ROOM_TTL секунд и продлеваются heartbeat'ом владельца,
+    поэтому комнаты упавшего узла исчезают сами.
+    Адрес узла должен вести ровно в этот процесс: несколько воркеров uvicorn
+    за одним портом не запустятся, каждому нужен свой NODE_URL
+    """
+    ROOM_PREFIX = 'room:'
+    NODE_PREFIX = 'node:'
+    URL_PREFIX = 'node_url:'
+
+    def __init__(
+        self,
+        node_id: str = settings.NODE_ID,
+        node_url: str = settings.node_url,
+        ttl: int = settings.ROOM_TTL,
+        heartbeat_interval: float = settings.ROOM_HEARTBEAT
+    ):
+        super().__init__(node_id, node_url)
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if not settings.NODE_TOKEN:
+            # Без пересылки чужие комнаты нельзя ни подключить, ни оставить в ожидании
+            raise RuntimeError('ROOM_REGISTRY=redis requires NODE_TOKEN')
+
+        redis_client = await RedisManager.get_redis()
+        url_key = f'{self.URL_PREFIX}{self.node_url}'
+        if not await redis_client.set(url_key, self.node_id, ex=self.ttl, nx=True):
+            other = await redis_client.get(url_key)
+            if other is not None and other.decode() != self.node_id:
+                raise RuntimeError(
+                    f'Node URL {self.node_url} is already used by node {other.decode()}, set a unique NODE_URL'
+                )
+
+        await self.heartbeat()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+        redis_client = await RedisManager.get_redis()
+        keys = [f'{self.ROOM_PREFIX}{room_id}' for room_id in self._rooms]
+        await redis_client.delete(f'{self.NODE_PREFIX}{self.node_id}', f'{self.URL_PREFIX}{self.node_url}', *keys)
+        self._rooms.clear()
+
+    async def heartbeat(self):
+        redis_client = await RedisManager.get_redis()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(f'{self.NODE_PREFIX}{self.node_id}', self.node_url, ex=self.ttl)
+            pipe.set(f'{self.URL_PREFIX}{self.node_url}', self.node_id, ex=self.ttl)
+            for room_id in self._rooms:
+                pipe.set(f'{self.ROOM_PREFIX}{room_id}', self.node_id, ex=self.ttl)
+            await pipe.execute()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.heartbeat()
+            except Exception:
+                logger.exception('Room registry heartbeat failed')
+
+    async def register(self, room_id: str):
+        await super().register(room_id)
+        redis_client = await RedisManager.get_redis()
+        await redis_client.set(f'{self.ROOM_PREFIX}{room_id}', self.node_id, ex=self.ttl)
+
+    async def unregister(self, room_id: str):
+        await super().unregister(room_id)
+        redis_client = await RedisManager.get_redis()
+        await redis_client.delete(f'{self.ROOM_PREFIX}{room_id}')
+
+    async def owner(self, room_id: str) -> Optional[str]:
+        if room_id in self._rooms:
+            return self.node_id
+        redis_client = await RedisManager.get_redis()
+        owner = await redis_client.get(f'{self.ROOM_PREFIX}{room_id}')
+        return owner.decode() if owner is not None else None
+
+    async def get_node_url(self, node_id: str) -> Optional[str]:
+        if node_id == self.node_id:
+            return self.node_url
+        redis_client = await RedisManager.get_redis()
+        url = await redis_client.get(f'{self.NODE_PREFIX}{node_id}')
+        return url.decode() if url is not None else None
+
+
+def create_registry(kind: str = settings.ROOM_REGISTRY) -> LocalRoomRegistry:
+    match kind:
+        case 'local':
+            return LocalRoomRegistry()
+        case 'redis':
+            return RedisRoomRegistry()
+    raise ValueError(f'Unknown room registry: {kind}')
+
+
+registry = create_registry()
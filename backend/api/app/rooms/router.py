@@ -1,66 +1,102 @@
+import asyncio
+import hmac
 from fastapi import APIRouter, Request, Depends, Body
 from fastapi.responses import JSONResponse
-from aiortc import RTCPeerConnection, RTCSessionDescription, MediaStreamTrack
-from aiortc.contrib.media import MediaRelay
 from pydantic.types import PastDate
 from datetime import date
 from common.schemas.user import UserInfo
 from common.schemas.params import SearchRoom
-import json
-import random
 from app.utils import get_user_id
 from common.core.config import settings
 from common.storage.rabbit import send_message
 from common.storage.redis import VectorStorage
-from logger import logger
+from common.storage.vector_cache import user_vector_cache
+from common.storage.vectors import unpack_vector
+from app.rooms.registry import registry
+from app.rooms.workers import create_media_server
 import numpy as np
+from aiohttp import ClientError, ClientSession, ClientTimeout
+from logger import logger
 
 router = APIRouter()
 
-rooms: dict[str, list[RTCPeerConnection]] = {}
-tracks: dict[RTCPeerConnection, set[MediaStreamTrack]] = {}
+async def on_room_closed(room_id: str):
+    await registry.unregister(room_id)
+    await VectorStorage.delete_room(room_id)
+
+media = create_media_server(on_room_closed=on_room_closed)
+
+node_session: ClientSession | None = None
+
+@router.on_event('startup')
+async def on_startup():
+    await VectorStorage.start_sync()
+    await registry.start()
+    await media.start()
 
 @router.on_event('shutdown')
 async def on_shutdown():
-    for room in rooms.values():
-        for pc in room:
-            await pc.close()
-
-async def send_user_list(room_id: str):
-    """Отправляет список пользователей в комнате всем участникам."""
-    if room_id in rooms:
-        user_ids = [pc.client_id for pc in rooms[room_id] if hasattr(pc, 'client_id')]
-        for pc in rooms[room_id]:
-            if hasattr(pc, 'data_channel') and pc.data_channel.readyState == 'open':
-                pc.data_channel.send(
-                    json.dumps({
-                        'action': 'users',
-                        'users': user_ids
-                    })
-                )
-
-async def find_available_room(user_id, is_male=None, age=None, country=None):
-    answer = await send_message({'user_id': user_id, 'action': 'get_user', 'target_user_id': user_id}, settings.MODEL_QUEUE, 'users', user_id, wait_answer=True)
-    vector = np.array(json.loads(answer))
-
-    rooms_id = await VectorStorage.search_rooms(vector, gender = "male" if is_male else "female" if is_male is False else None, age=age, country=country)
+    await media.close()
+    await VectorStorage.stop_sync()
+    await registry.stop()
+    if node_session is not None:
+        await node_session.close()
+
+async def forward_to_node(node_id: str | None, path: str, payload: dict, request: Request) -> JSONResponse | None:
+    """
+    Передаёт сигнальный запрос узлу, который владеет комнатой.
+    Возвращает None, если узел неизвестен, недоступен или ответил не JSON
+    """
+    global node_session
+
+    if node_id is None or node_id == registry.node_id or not settings.NODE_TOKEN:
+        return None
 
-    if not rooms_id:
+    node_url = await registry.get_node_url(node_id)
+    if node_url is None:
         return None
 
-    room_id = random.choice(rooms_id)
-    if room_id not in rooms:
-        await VectorStorage.delete_room(room_id)
-        return await find_available_room(user_id, is_male, age, country)
+    if node_session is None:
+        node_session = ClientSession(timeout=ClientTimeout(total=settings.NODE_TIMEOUT))
+
+    try:
+        async with node_session.post(
+            f'{node_url}/room{path}',
+            json=payload,
+            cookies=request.cookies,
+            headers={'X-Node-Token': settings.NODE_TOKEN},
+        ) as response:
+            return JSONResponse(content=await response.json(), status_code=response.status)
+    except (ClientError, asyncio.TimeoutError, ValueError) as e:
+        logger.warning(f'Node {node_id} did not answer {path}: {e!r}')
+        return None
 
-    await VectorStorage.delete_room(room_id)
+def is_node_request(request: Request) -> bool:
+    token = request.headers.get('X-Node-Token')
+    if not settings.NODE_TOKEN or token is None:
+        return False
+    return hmac.compare_digest(token.encode(), settings.NODE_TOKEN.encode())
 
-    return room_id
+@router.get('/stats')
+async def stats():
+    return {'index': VectorStorage.stats(), 'user_vectors': user_vector_cache.stats(), 'media': await media.stats()}
 
-async def save_room(user_id):
+async def load_user_vector(user_id: str) -> np.ndarray | None:
     answer = await send_message({'user_id': user_id, 'action': 'get_user', 'target_user_id': user_id}, settings.MODEL_QUEUE, 'users', user_id, wait_answer=True)
-    vector = json.loads(answer)
+    if not isinstance(answer, bytes) or not answer:
+        return None
+    return unpack_vector(answer)
+
+async def find_available_room(vector, is_male=None, age=None, country=None):
+    return await VectorStorage.claim_room(
+        vector,
+        is_alive=registry.is_alive,
+        gender="male" if is_male else "female" if is_male is False else None,
+        age=age,
+        country=country
+    )
 
+async def save_room(user_id, vector):
     answer = await send_message({'user_id': user_id, 'action': 'get_user_info'}, settings.DB_QUEUE, 'users', user_id, wait_answer=True)
     user: UserInfo = UserInfo.model_validate_json(answer)
 
@@ -69,129 +105,83 @@ async def save_room(user_id):
     if (today.month, today.day) < (user.birthdate.month, user.birthdate.day):
         age -= 1
 
-    await VectorStorage.save_vector(user_id, np.array(vector), "male" if user.is_male else "female" if user.is_male is False else None, age, user.country)
+    await VectorStorage.save_vector(user_id, vector, "male" if user.is_male else "female" if user.is_male is False else None, age, user.country)
 
 @router.post('/initiate_connection')
 async def initiate_connection(
     params: SearchRoom,
+    request: Request,
     user_id: str = Depends(get_user_id)
 ):
 
-    room_id = await find_available_room(user_id, params.is_male, params.age, params.country)
+    vector = await user_vector_cache.get_or_load(user_id, load_user_vector)
+    if vector is None:
+        # data_processor не ответил или ещё не посчитал вектор пользователя
+        return JSONResponse(
+            content={'error': 'User vector is not ready yet.'},
+            status_code=503,
+            headers={'Retry-After': '5'}
+        )
+
+    claim = await find_available_room(vector, params.is_male, params.age, params.country)
+    room_id = claim[0] if claim else None
+
+    if room_id and not media.has_room(room_id):
+        # Комната живёт на другом узле - подключаем клиента там
+        owner = await registry.owner(room_id)
+        response = await forward_to_node(owner, f'/join/{room_id}', {}, request)
+        if response is not None and response.status_code != 404:
+            return response
+        if response is None:
+            # Владелец не ответил, но комната у него может быть жива - возвращаем её в ожидание
+            await VectorStorage.restore_room(room_id, claim[1])
+        # Клиенту создаём свою комнату
+        room_id = None
 
     if not room_id:
         room_id = user_id
-        await save_room(room_id)
-        rooms[room_id] = []
-
-    pc = RTCPeerConnection()
-    pc.client_id = str(random.randint(0, 100)).rjust(3, '0')
-    
-    data_channel = pc.createDataChannel('renegotiation')
-    pc.data_channel = data_channel
-
-    @data_channel.on("open")
-    async def on_open():
-        await send_user_list(room_id)
-
-    @data_channel.on('message')
-    async def on_message(message):
-        if message == 'keepalive':
-            data_channel.send('keepalive')
-            return
-
-        offerData = json.loads(message)
-        await pc.setRemoteDescription(RTCSessionDescription(sdp=offerData['sdp'], type=offerData['type']))
-        answer = await pc.createAnswer()
-        await pc.setLocalDescription(answer)
-        data_channel.send(
-            json.dumps({
-                'action': 'answer',
-                'sdp': pc.localDescription.sdp,
-                'type': pc.localDescription.type,
-            })
-        )
+        await media.create_room(room_id)
+        await registry.register(room_id)
+        await save_room(room_id, vector)
 
-    # pc.addTransceiver('audio', 'recvonly')
-    pc.addTransceiver('video', 'recvonly')
-    
-    rooms[room_id].append(pc)
-    tracks[pc] = set()
-    
-    for other_pc in rooms[room_id]:
-        if other_pc != pc:
-            for track in tracks[other_pc]:
-                pc.addTransceiver(MediaRelay().subscribe(track), 'sendonly')
-
-    @pc.on('iceconnectionstatechange')
-    async def on_iceconnectionstatechange():
-        if pc.iceConnectionState in ('failed', 'disconnected', 'closed'):
-            logger.info(f'Client {pc.client_id} disconnected')
-            
-            await remove_client_from_room(pc)
-
-    @pc.on('track')
-    async def on_track(track):
-        if track.kind not in ('video'):
-            return
-
-        tracks[pc].add(track)
-
-        for other_pc in rooms[room_id]:
-            if other_pc != pc:
-                other_pc.addTrack(MediaRelay().subscribe(track))
-                if hasattr(other_pc, 'data_channel') and other_pc.data_channel.readyState == 'open':
-                    other_pc.data_channel.send(
-                        json.dumps({'action': 'renegotiating'})
-                    )
-
-    offer = await pc.createOffer()
-    await pc.setLocalDescription(offer)
-
-    return JSONResponse(
-        content={
-            'sdp': pc.localDescription.sdp,
-            'type': pc.localDescription.type,
-            'id': pc.client_id,
-            'room_id': room_id
-        }
-    )
+    return await connect_to_room(room_id)
+
+@router.post('/join/{room_id}', include_in_schema=False)
+async def join(room_id: str, request: Request):
+    """Подключение к локальной комнате по запросу другого узла"""
+    if not is_node_request(request):
+        return JSONResponse(content={'error': 'Forbidden.'}, status_code=403)
+
+    if not media.has_room(room_id):
+        return JSONResponse(content={'error': 'Room not found.'}, status_code=404)
+
+    return await connect_to_room(room_id)
+
+async def connect_to_room(room_id: str) -> JSONResponse:
+    offer = await media.connect(room_id)
+    if offer is None:
+        return JSONResponse(content={'error': 'Room not found.'}, status_code=404)
+    return JSONResponse(content=offer)
 
 @router.post('/answer')
 async def answer(request: Request):
     params = await request.json()
-    answer = RTCSessionDescription(sdp=params['sdp'], type=params['type'])
     client_id = params['id']
     room_id = params['room_id']
 
-    if room_id not in rooms:
-        return JSONResponse(content={'error': 'Room not found.'}, status_code=404)
-    
-    pc = next((p for p in rooms[room_id] if hasattr(p, 'client_id') and p.client_id == client_id), None)
-
-    if not pc:
+    if not media.has_room(room_id):
+        if is_node_request(request):
+            # Запрос уже переслан сюда другим узлом: дальше не пересылаем, чтобы он не ходил по кругу
+            return JSONResponse(content={'error': 'Room not found.'}, status_code=404)
+        owner = await registry.owner(room_id)
+        if owner is None or owner == registry.node_id:
+            return JSONResponse(content={'error': 'Room not found.'}, status_code=404)
+        response = await forward_to_node(owner, '/answer', params, request)
+        if response is None:
+            return JSONResponse(content={'error': 'Room owner is unavailable.'}, status_code=502)
+        return response
+
+    if not await media.answer(room_id, client_id, params['sdp'], params['type']):
         return JSONResponse(content={'error': 'Peer connection not found.'}, status_code=404)
 
-    await pc.setRemoteDescription(answer)
-    logger.info(f'Client {client_id} connected to room {room_id}')
-    await send_user_list(room_id)
     return JSONResponse(content={'message': 'Connection established.'})
-
-async def remove_client_from_room(pc: RTCPeerConnection):
-    for room_id, room in list(rooms.items()):
-        if pc in room:
-            room.remove(pc)
-
-            for other_pc in room:
-                await other_pc.close()
-                if other_pc in tracks:
-                    del tracks[other_pc]
-            
-            if room_id in rooms:
-                del rooms[room_id]
-
-            if pc in tracks:
-                del tracks[pc]
-
-            break
-    await pc.close()
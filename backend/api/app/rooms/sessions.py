@@ -0,0 +1,66 @@
+from typing import Iterator, Optional
+from uuid import uuid4
+
+from aiortc import RTCDataChannel, RTCPeerConnection, MediaStreamTrack
+
+
+class PeerSession:
+    """Подключение одного клиента к комнате"""
+    __slots__ = ('peer_id', 'room_id', 'pc', 'data_channel', 'tracks')
+
+    def __init__(self, peer_id: str, room_id: str, pc: RTCPeerConnection, data_channel: RTCDataChannel):
+        self.peer_id = peer_id
+        self.room_id = room_id
+        self.pc = pc
+        self.data_channel = data_channel
+        # входящие треки клиента, которые раздаются остальным участникам
+        self.tracks: set[MediaStreamTrack] = set()
+
+    def send(self, message: str):
+        if self.data_channel.readyState == 'open':
+            self.data_channel.send(message)
+
+
+class SessionRegistry:
+    """
+    Сессии узла с индексами pc -> сессия и (room_id, peer_id) -> сессия,
+    чтобы ответ и отключение клиента не зависели от числа комнат
+    """
+
+    def __init__(self):
+        self._by_pc: dict[RTCPeerConnection, PeerSession] = {}
+        self._rooms: dict[str, dict[str, PeerSession]] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_pc)
+
+    def has_room(self, room_id: str) -> bool:
+        return room_id in self._rooms
+
+    def room_ids(self) -> Iterator[str]:
+        return iter(self._rooms)
+
+    def create_room(self, room_id: str):
+        self._rooms.setdefault(room_id, {})
+
+    def add(self, room_id: str, pc: RTCPeerConnection, data_channel: RTCDataChannel) -> PeerSession:
+        session = PeerSession(uuid4().hex, room_id, pc, data_channel)
+        self._rooms[room_id][session.peer_id] = session
+        self._by_pc[pc] = session
+        return session
+
+    def get(self, room_id: str, peer_id: str) -> Optional[PeerSession]:
+        return self._rooms.get(room_id, {}).get(peer_id)
+
+    def by_pc(self, pc: RTCPeerConnection) -> Optional[PeerSession]:
+        return self._by_pc.get(pc)
+
+    def members(self, room_id: str) -> list[PeerSession]:
+        return list(self._rooms.get(room_id, {}).values())
+
+    def pop_room(self, room_id: str) -> list[PeerSession]:
+        """Удаляет комнату вместе со всеми её сессиями"""
+        sessions = list(self._rooms.pop(room_id, {}).values())
+        for session in sessions:
+            self._by_pc.pop(session.pc, None)
+        return sessions
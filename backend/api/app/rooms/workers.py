@@ -0,0 +1,223 @@
+import asyncio
+import itertools
+import multiprocessing
+import threading
+from multiprocessing.connection import Connection
+from typing import Optional
+
+from common.core.config import settings
+from app.rooms.media import MediaServer, RoomClosedCallback
+from logger import logger
+
+
+# Сообщения по каналу воркера - кортежи (kind, call_id, payload):
+#   API -> воркер:  ('call', id, (method, args)) и ('stop', None, None)
+#   воркер -> API:  ('result', id, value), ('error', id, message), ('room_closed', None, room_id)
+WORKER_METHODS = {'create_room', 'connect', 'answer', 'stats'}
+
+
+def run_worker(conn: Connection):
+    """Точка входа процесса медиа-воркера"""
+    asyncio.run(_serve(conn))
+
+
+async def _serve(conn: Connection):
+    loop = asyncio.get_running_loop()
+
+    async def on_room_closed(room_id: str):
+        conn.send(('room_closed', None, room_id))
+
+    server = MediaServer(on_room_closed)
+    tasks: set[asyncio.Task] = set()
+
+    async def dispatch(call_id: int, method: str, args: tuple):
+        try:
+            if method not in WORKER_METHODS:
+                raise ValueError(f'Unknown media method: {method}')
+            conn.send(('result', call_id, await getattr(server, method)(*args)))
+        except Exception as e:
+            logger.exception(f'Media worker call {method} failed')
+            conn.send(('error', call_id, str(e)))
+
+    while True:
+        try:
+            kind, call_id, payload = await loop.run_in_executor(None, conn.recv)
+        except (EOFError, OSError):
+            break
+        if kind == 'stop':
+            break
+        task = asyncio.create_task(dispatch(call_id, *payload))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.wait(tasks)
+    await server.close()
+
+
+class MediaWorker:
+    """Процесс-воркер и канал к нему со стороны API"""
+
+    def __init__(self, index: int, context):
+        self.index = index
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=run_worker, args=(child_conn,), name=f'media-worker-{index}', daemon=True)
+        self.rooms: set[str] = set()
+        self.pending: dict[int, asyncio.Future] = {}
+        self.alive = False
+        self._child_conn = child_conn
+
+    def start(self, on_message, on_exit):
+        self.process.start()
+        self._child_conn.close()
+        self.alive = True
+
+        loop = asyncio.get_running_loop()
+
+        def read():
+            while True:
+                try:
+                    message = self.conn.recv()
+                except (EOFError, OSError):
+                    break
+                loop.call_soon_threadsafe(on_message, self, message)
+            loop.call_soon_threadsafe(on_exit, self)
+
+        threading.Thread(target=read, name=f'media-worker-{self.index}-reader', daemon=True).start()
+
+
+class MediaWorkerPool:
+    """
+    Медиа-воркеры: RTCPeerConnection'ы комнат живут в отдельных процессах,
+    API только пересылает им SDP. Новая комната достаётся наименее загруженному воркеру
+    """
+
+    def __init__(self, size: int, on_room_closed: Optional[RoomClosedCallback] = None):
+        self.size = size
+        self.on_room_closed = on_room_closed
+        self._workers: list[MediaWorker] = []
+        self._room_workers: dict[str, MediaWorker] = {}
+        self._call_ids = itertools.count()
+        # Ссылки на фоновые задачи on_room_closed, иначе их может собрать сборщик мусора
+        self._tasks: set[asyncio.Task] = set()
+
+    async def start(self):
+        context = multiprocessing.get_context('spawn')
+        self._workers = [MediaWorker(i, context) for i in range(self.size)]
+        for worker in self._workers:
+            worker.start(self._on_message, self._on_exit)
+        logger.info(f'Started {self.size} media workers')
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        for worker in self._workers:
+            if worker.alive:
+                worker.alive = False
+                worker.conn.send(('stop', None, None))
+        for worker in self._workers:
+            await loop.run_in_executor(None, worker.process.join, 5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._workers.clear()
+        self._room_workers.clear()
+        if self._tasks:
+            await asyncio.wait(self._tasks)
+
+    def _on_message(self, worker: MediaWorker, message: tuple):
+        kind, call_id, payload = message
+        if kind == 'room_closed':
+            self._forget_room(payload)
+            return
+
+        future = worker.pending.pop(call_id, None)
+        if future is None or future.done():
+            return
+        if kind == 'error':
+            future.set_exception(RuntimeError(payload))
+        else:
+            future.set_result(payload)
+
+    def _on_exit(self, worker: MediaWorker):
+        if not worker.alive:
+            return
+        worker.alive = False
+        logger.error(f'Media worker {worker.index} exited, dropping {len(worker.rooms)} rooms')
+
+        for future in worker.pending.values():
+            if not future.done():
+                future.set_exception(RuntimeError('Media worker exited'))
+        worker.pending.clear()
+
+        for room_id in list(worker.rooms):
+            self._forget_room(room_id)
+
+    def _forget_room(self, room_id: str):
+        worker = self._room_workers.pop(room_id, None)
+        if worker is None:
+            return
+        worker.rooms.discard(room_id)
+        if self.on_room_closed is not None:
+            task = asyncio.create_task(self.on_room_closed(room_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _call(self, worker: MediaWorker, method: str, *args):
+        if not worker.alive:
+            raise RuntimeError('Media worker exited')
+        call_id = next(self._call_ids)
+        future = asyncio.get_running_loop().create_future()
+        worker.pending[call_id] = future
+        worker.conn.send(('call', call_id, (method, args)))
+        return await future
+
+    def has_room(self, room_id: str) -> bool:
+        return room_id in self._room_workers
+
+    async def create_room(self, room_id: str):
+        if room_id in self._room_workers:
+            return
+        workers = [worker for worker in self._workers if worker.alive]
+        if not workers:
+            raise RuntimeError('No media workers available')
+
+        worker = min(workers, key=lambda w: len(w.rooms))
+        worker.rooms.add(room_id)
+        self._room_workers[room_id] = worker
+        await self._call(worker, 'create_room', room_id)
+
+    async def connect(self, room_id: str) -> Optional[dict]:
+        worker = self._room_workers.get(room_id)
+        if worker is None:
+            return None
+        return await self._call(worker, 'connect', room_id)
+
+    async def answer(self, room_id: str, client_id: str, sdp: str, type: str) -> bool:
+        worker = self._room_workers.get(room_id)
+        if worker is None:
+            return False
+        return await self._call(worker, 'answer', room_id, client_id, sdp, type)
+
+    async def stats(self) -> dict:
+        workers = [worker for worker in self._workers if worker.alive]
+        results = await asyncio.gather(*(self._call(worker, 'stats') for worker in workers), return_exceptions=True)
+
+        rooms, peers = {}, 0
+        for result in results:
+            if isinstance(result, dict):
+                rooms.update(result['rooms'])
+                peers += result['peers']
+        return {
+            'workers': len(self._workers),
+            'peers': peers,
+            'rooms_per_worker': [len(worker.rooms) if worker.alive else None for worker in self._workers],
+            'rooms': rooms,
+        }
+
+
+def create_media_server(
+    workers: int = settings.MEDIA_WORKERS,
+    on_room_closed: Optional[RoomClosedCallback] = None
+) -> MediaServer | MediaWorkerPool:
+    if workers > 0:
+        return MediaWorkerPool(workers, on_room_closed)
+    return MediaServer(on_room_closed)
@@ -0,0 +1,85 @@
+"""Общие помощники бенчмарков: пути импорта сервисов, статистика, вывод таблиц"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterable, Sequence
+
+import numpy as np
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def use_service(name: str):
+    """
+    Сервисы импортируют свой logger.py и обработчики из рабочего каталога,
+    поэтому каталог сервиса добавляется в sys.path вместе с backend/
+    """
+    for path in (os.path.join(BACKEND_DIR, name), BACKEND_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def latency_stats(samples: Sequence[float]) -> dict:
+    """Статистика по задержкам в секундах, результат в миллисекундах"""
+    if not len(samples):
+        return {'n': 0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0}
+    ms = np.asarray(samples, dtype=np.float64) * 1000
+    return {
+        'n': len(ms),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+    }
+
+
+def print_table(rows: Iterable[dict], title: str = ''):
+    rows = list(rows)
+    if not rows:
+        return
+    columns = list(rows[0])
+    cells = [[_format(row.get(column)) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(columns)]
+
+    if title:
+        print(f'\n{title}')
+    print('  '.join(column.rjust(width) for column, width in zip(columns, widths)))
+    for line in cells:
+        print('  '.join(cell.rjust(width) for cell, width in zip(line, widths)))
+
+
+def _format(value) -> str:
+    if isinstance(value, float):
+        return f'{value:.4g}' if abs(value) < 1000 else f'{value:.0f}'
+    return str(value)
+
+
+@contextmanager
+def timer():
+    """with timer() as elapsed: ...; elapsed() - секунды с начала блока"""
+    start = time.perf_counter()
+    end = None
+
+    def elapsed() -> float:
+        return (end or time.perf_counter()) - start
+
+    try:
+        yield elapsed
+    finally:
+        end = time.perf_counter()
+
+
+def random_unit_vectors(n: int, dim: int, rng: np.random.Generator, clusters: int = 0) -> np.ndarray:
+    """
+    Случайные нормированные векторы. При clusters > 0 - смесь гауссовых кластеров,
+    что ближе к реальным эмбеддингам описаний, чем равномерный шум
+    """
+    if clusters:
+        centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+        vectors = centers[rng.integers(clusters, size=n)] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    else:
+        vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
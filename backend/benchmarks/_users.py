@@ -0,0 +1,36 @@
+"""Тестовые пользователи в Postgres для бенчмарков pg_consumer"""
+from datetime import date, timedelta
+from uuid import uuid4
+
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from common.storage.models.user import User
+
+
+PREFIX = 'bench_user_'
+
+
+async def seed_users(engine: AsyncEngine, count: int) -> list[dict]:
+    """Пересоздаёт count пользователей bench_user_*, возвращает их id и username"""
+    rows = [
+        {
+            'id': uuid4(),
+            'username': f'{PREFIX}{i}',
+            'password': 'x' * 60,
+            'is_male': i % 2 == 0,
+            'birthdate': date(1980, 1, 1) + timedelta(days=i % 10000),
+            'country': 'RU',
+            'description': 'Люблю походы, настолки и джаз',
+        }
+        for i in range(count)
+    ]
+    async with engine.begin() as conn:
+        await conn.execute(delete(User).where(User.username.like(f'{PREFIX}%')))
+        await conn.execute(insert(User), rows)
+    return [{'user_id': str(row['id']), 'username': row['username']} for row in rows]
+
+
+async def delete_users(engine: AsyncEngine):
+    async with engine.begin() as conn:
+        await conn.execute(delete(User).where(User.username.like(f'{PREFIX}%')))
@@ -0,0 +1,154 @@
+"""
+Конкурентный захват комнат через VectorStorage.claim_room.
+
+Несколько процессов (как несколько узлов API) со своими индексами одновременно
+забирают комнаты из одного Redis. Меряются claims/sec, задержка захвата и доля
+двойных захватов - комнат, которые получили два клиента. Режим naive повторяет
+прежнюю схему "поиск, EXISTS, DEL" для сравнения.
+
+    cd backend && python -m benchmarks.claim_rooms --rooms 2000 --processes 4 --concurrency 50
+
+Ключи пишутся в Redis из .env под префиксом bench:vector: и удаляются в конце.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import random
+import time
+from collections import Counter
+
+import numpy as np
+
+from benchmarks._common import latency_stats, print_table, random_unit_vectors, use_service
+
+use_service('api')
+
+from common.storage.redis import RedisManager, VectorStorage  # noqa: E402
+
+
+PREFIX = 'bench:vector:'
+FILTERS = {'gender': 'male', 'age': 25, 'country': 'RU'}
+
+
+async def always_alive(room_id: str) -> bool:
+    return True
+
+
+async def naive_claim(query: np.ndarray, top_k: int, threshold: float) -> str | None:
+    """Захват без атомарности: между EXISTS и DEL комнату может забрать другой клиент"""
+    redis_client = await RedisManager.get_redis()
+    for room_id in await VectorStorage.search_rooms(query, top_k=top_k, similarity_threshold=threshold, **FILTERS):
+        key = f'{VectorStorage.PREFIX}{room_id}'
+        if await redis_client.exists(key):
+            await redis_client.delete(key)
+            VectorStorage.index.remove(room_id)
+            return room_id
+    return None
+
+
+async def run_claimers(mode: str, vectors: np.ndarray, concurrency: int, top_k: int, threshold: float, max_misses: int, seed: int):
+    VectorStorage.PREFIX = PREFIX
+    await VectorStorage.start_sync()
+    rng = np.random.default_rng(seed)
+
+    claimed: list[str] = []
+    latencies: list[float] = []
+
+    async def claimer():
+        misses = 0
+        while misses < max_misses:
+            # Запрос похож на случайную комнату, чтобы совпадения были всегда, пока комнаты есть
+            query = vectors[rng.integers(len(vectors))] + 0.05 * rng.standard_normal(vectors.shape[1]).astype(np.float32)
+            start = time.perf_counter()
+            if mode == 'atomic':
+                claim = await VectorStorage.claim_room(query, is_alive=always_alive, top_k=top_k, similarity_threshold=threshold, **FILTERS)
+                room_id = claim[0] if claim else None
+            else:
+                room_id = await naive_claim(query, top_k, threshold)
+            latencies.append(time.perf_counter() - start)
+
+            if room_id is None:
+                misses += 1
+            else:
+                misses = 0
+                claimed.append(room_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(claimer() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    await VectorStorage.stop_sync()
+    return claimed, latencies, elapsed
+
+
+def worker(args):
+    return asyncio.run(run_claimers(*args))
+
+
+async def seed_rooms(vectors: np.ndarray):
+    VectorStorage.PREFIX = PREFIX
+    redis_client = await RedisManager.get_redis()
+    await cleanup()
+    for i, vector in enumerate(vectors):
+        await VectorStorage.save_vector(f'room-{i}', vector, FILTERS['gender'], FILTERS['age'], FILTERS['country'])
+    await redis_client.aclose()
+    RedisManager._client = None
+
+
+async def cleanup():
+    redis_client = await RedisManager.get_redis()
+    keys = [key async for key in redis_client.scan_iter(match=f'{PREFIX}*', count=1000)]
+    if keys:
+        await redis_client.delete(*keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rooms', type=int, default=2000)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=50, help='одновременных клиентов на процесс')
+    parser.add_argument('--dim', type=int, default=312)
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--threshold', type=float, default=0.6)
+    parser.add_argument('--max-misses', type=int, default=5, help='клиент останавливается после стольких промахов подряд')
+    parser.add_argument('--modes', default='atomic,naive')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = random_unit_vectors(args.rooms, args.dim, rng, clusters=32)
+    context = multiprocessing.get_context('spawn')
+
+    rows = []
+    for mode in args.modes.split(','):
+        asyncio.run(seed_rooms(vectors))
+
+        jobs = [
+            (mode, vectors, args.concurrency, args.top_k, args.threshold, args.max_misses, random.randrange(2 ** 32))
+            for _ in range(args.processes)
+        ]
+        with context.Pool(args.processes) as pool:
+            results = pool.map(worker, jobs)
+
+        claimed = [room_id for result in results for room_id in result[0]]
+        latencies = [latency for result in results for latency in result[1]]
+        elapsed = max(result[2] for result in results)
+        counts = Counter(claimed)
+        duplicates = sum(count - 1 for count in counts.values())
+
+        rows.append({
+            'mode': mode,
+            'rooms': args.rooms,
+            'claimed': len(counts),
+            'claims': len(claimed),
+            'double_claims': duplicates,
+            'double_rate': duplicates / len(claimed) if claimed else 0.0,
+            'claims_per_s': len(claimed) / elapsed if elapsed else 0.0,
+            **latency_stats(latencies),
+        })
+
+    asyncio.run(cleanup())
+    print_table(rows, f'claim_room: {args.processes} processes x {args.concurrency} clients')
+
+
+if __name__ == '__main__':
+    main()
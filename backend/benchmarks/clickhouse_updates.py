@@ -0,0 +1,155 @@
+"""
+Обновление векторов в ClickHouse: новая версия строки в ReplacingMergeTree(updated_at)
+против прежней схемы "ALTER TABLE ... DELETE + INSERT" в обычном MergeTree.
+
+Режимы:
+    alter   - ALTER DELETE и INSERT на каждое обновление (как было раньше)
+    append  - INSERT одной строки на обновление в ReplacingMergeTree
+    batched - те же строки, но пачками по --batch (как VectorWriteBuffer)
+
+Меряются updates/sec, задержка обновления, задержка чтения через FINAL после обновлений
+и число незавершённых мутаций, которые оставляет после себя режим alter.
+
+    cd backend && python -m benchmarks.clickhouse_updates --users 10000 --updates 2000 --concurrency 8
+
+Таблицы bench_user_vectors_* создаются в базе из .env и удаляются в конце.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import numpy as np
+
+from benchmarks._common import latency_stats, print_table, random_unit_vectors, use_service
+
+use_service('api')
+
+from common.storage.clickhouse import ClickHouseAsyncClient, encode_vector_row  # noqa: E402
+
+
+TABLE_DDL = '''
+CREATE TABLE {table} (
+    userid UUID,
+    vector Array(Float32),
+    updated_at DateTime64(3) DEFAULT now64(3)
+) ENGINE = {engine}
+ORDER BY userid
+'''
+
+ENGINES = {
+    'alter': ('bench_user_vectors_mergetree', 'MergeTree'),
+    'append': ('bench_user_vectors_replacing', 'ReplacingMergeTree(updated_at)'),
+    'batched': ('bench_user_vectors_replacing', 'ReplacingMergeTree(updated_at)'),
+}
+
+
+def now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+async def insert_rows(client: ClickHouseAsyncClient, table: str, rows: list[tuple[str, np.ndarray]]):
+    payload = b''.join(encode_vector_row(userid, vector, now_ms()) for userid, vector in rows)
+    await client.insert_raw(f'INSERT INTO {table} (userid, vector, updated_at) FORMAT RowBinary', payload)
+
+
+async def prepare_table(client: ClickHouseAsyncClient, table: str, engine: str, userids: list[str], vectors: np.ndarray, chunk: int = 5000):
+    await client.fetch_raw(f'DROP TABLE IF EXISTS {table}')
+    await client.fetch_raw(TABLE_DDL.format(table=table, engine=engine))
+    for start in range(0, len(userids), chunk):
+        await insert_rows(client, table, list(zip(userids[start:start + chunk], vectors[start:start + chunk])))
+
+
+async def run_updates(client: ClickHouseAsyncClient, mode: str, table: str, updates: list[tuple[str, np.ndarray]], concurrency: int, batch: int) -> tuple[float, list[float]]:
+    latencies: list[float] = []
+
+    if mode == 'batched':
+        jobs = iter([updates[i:i + batch] for i in range(0, len(updates), batch)])
+    else:
+        jobs = iter([[update] for update in updates])
+
+    async def updater():
+        for rows in jobs:
+            start = time.perf_counter()
+            if mode == 'alter':
+                userid, _ = rows[0]
+                await client.fetch_raw(f'ALTER TABLE {table} DELETE WHERE userid = {{userid:UUID}}', params={'userid': userid})
+            await insert_rows(client, table, rows)
+            latencies.append((time.perf_counter() - start) / len(rows))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(updater() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+
+async def read_latencies(client: ClickHouseAsyncClient, table: str, userids: list[str], samples: int, rng: np.random.Generator) -> list[float]:
+    final = ' FINAL' if table == ENGINES['append'][0] else ''
+    latencies = []
+    for index in rng.integers(len(userids), size=samples):
+        start = time.perf_counter()
+        await client.fetch_raw(
+            f'SELECT vector FROM {table}{final} WHERE userid = {{userid:UUID}} FORMAT RowBinary',
+            params={'userid': userids[index]}
+        )
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def pending_mutations(client: ClickHouseAsyncClient, table: str) -> int:
+    body = await client.fetch_raw(
+        'SELECT count() FROM system.mutations WHERE database = currentDatabase() AND table = {table:String} AND NOT is_done FORMAT TSV',
+        params={'table': table}
+    )
+    return int(body or 0)
+
+
+async def main(args):
+    rng = np.random.default_rng(0)
+    userids = [str(uuid.UUID(int=int(value))) for value in rng.integers(1, 2 ** 63, size=args.users)]
+    vectors = random_unit_vectors(args.users, args.dim, rng)
+
+    targets = rng.integers(args.users, size=args.updates)
+    updates = list(zip((userids[i] for i in targets), random_unit_vectors(args.updates, args.dim, rng)))
+
+    client = ClickHouseAsyncClient(pool_size=max(args.concurrency, 1))
+    await client.start()
+
+    rows = []
+    tables = set()
+    try:
+        for mode in args.modes.split(','):
+            table, engine = ENGINES[mode]
+            tables.add(table)
+            await prepare_table(client, table, engine, userids, vectors)
+
+            elapsed, latencies = await run_updates(client, mode, table, updates, args.concurrency, args.batch)
+            pending = await pending_mutations(client, table)
+            reads = latency_stats(await read_latencies(client, table, userids, args.reads, rng))
+
+            rows.append({
+                'mode': mode,
+                'updates': args.updates,
+                'updates_per_s': args.updates / elapsed,
+                **latency_stats(latencies),
+                'read_p50_ms': reads['p50_ms'],
+                'read_p99_ms': reads['p99_ms'],
+                'pending_mutations': pending,
+            })
+    finally:
+        for table in tables:
+            await client.fetch_raw(f'DROP TABLE IF EXISTS {table}')
+        await client.close()
+
+    print_table(rows, f'user_vectors updates: {args.users} users, concurrency {args.concurrency}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--batch', type=int, default=500, help='строк в одном INSERT для режима batched')
+    parser.add_argument('--reads', type=int, default=200, help='чтений через FINAL после обновлений')
+    parser.add_argument('--dim', type=int, default=312)
+    parser.add_argument('--modes', default='alter,append,batched')
+    asyncio.run(main(parser.parse_args()))
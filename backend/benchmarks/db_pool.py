@@ -0,0 +1,119 @@
+"""
+Пропускная способность pg_consumer на get_user_info и get_user в режимах DB_POOL_MODE:
+pgbouncer (NullPool, новое соединение на каждое сообщение) и pool (QueuePool с кэшем
+prepared statements).
+
+Каждый режим запускается в отдельном процессе, потому что движок создаётся при импорте
+common.storage.database. Сообщения идут через handle_event_distribution без reply_to,
+поэтому ответ в RabbitMQ не отправляется и меряется только работа с базой.
+
+    cd backend && python -m benchmarks.db_pool --messages 5000 --concurrency 10
+
+Пользователи bench_user_* создаются в базе из .env и удаляются в конце.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+
+from benchmarks._common import latency_stats, print_table, use_service
+
+use_service('pg_consumer')
+
+
+ACTIONS = ('get_user_info', 'get_user')
+
+
+async def run_mode(mode: str, users: list[dict], messages: int, concurrency: int, warmup: int) -> list[dict]:
+    os.environ['DB_POOL_MODE'] = mode
+
+    from sqlalchemy import event
+    from common.storage.database import engine
+    from handlers.event_distribution import handle_event_distribution
+
+    connects = 0
+
+    def on_connect(*args):
+        nonlocal connects
+        connects += 1
+
+    event.listen(engine.sync_engine, 'connect', on_connect)
+
+    async def run(action: str, count: int) -> tuple[float, list[float]]:
+        latencies: list[float] = []
+        remaining = iter(range(count))
+
+        async def consumer():
+            for _ in remaining:
+                body = {'action': action, **random.choice(users)}
+                start = time.perf_counter()
+                await handle_event_distribution(body)
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(consumer() for _ in range(concurrency)))
+        return time.perf_counter() - start, latencies
+
+    rows = []
+    try:
+        for action in ACTIONS:
+            await run(action, warmup)
+            connects = 0
+            elapsed, latencies = await run(action, messages)
+            rows.append({
+                'mode': mode,
+                'action': action,
+                'msgs_per_s': messages / elapsed,
+                'connects': connects,
+                **latency_stats(latencies),
+            })
+    finally:
+        await engine.dispose()
+    return rows
+
+
+def worker(args):
+    return asyncio.run(run_mode(*args))
+
+
+async def prepare(users: int, cleanup: bool = False):
+    from common.storage.database import create_engine
+    from benchmarks._users import delete_users, seed_users
+
+    engine = create_engine('pool')
+    try:
+        if cleanup:
+            await delete_users(engine)
+            return []
+        return await seed_users(engine, users)
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=10, help='как CONSUMER_CONCURRENCY')
+    parser.add_argument('--warmup', type=int, default=200)
+    parser.add_argument('--modes', default='pgbouncer,pool')
+    args = parser.parse_args()
+
+    users = asyncio.run(prepare(args.users))
+    context = multiprocessing.get_context('spawn')
+
+    rows = []
+    try:
+        for mode in args.modes.split(','):
+            with context.Pool(1) as pool:
+                rows.extend(pool.apply(worker, ((mode, users, args.messages, args.concurrency, args.warmup),)))
+    finally:
+        asyncio.run(prepare(args.users, cleanup=True))
+
+    print_table(rows, f'pg_consumer: {args.messages} messages, concurrency {args.concurrency}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+Нагрузочный тест медиа-комнат: сколько комнат выдерживает одно ядро.
+
+В основном процессе поднимается MediaServer (inline) или MediaWorkerPool (workers:N)
+за маленьким HTTP-сервером сигналинга. Клиенты - настоящие aiortc-подключения
+в отдельных процессах: каждый шлёт синтетическое видео и пересогласовывается
+по data channel так же, как frontend/src/services/client.js. После прогрева
+считаются кадры, полученные клиентами, и процессорное время сервера
+(процесс API и медиа-воркеры).
+
+    cd backend && python -m benchmarks.media_rooms --rooms 1,5,10,20 --modes inline,workers:2
+
+Только Linux: загрузка процессора читается из /proc.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from benchmarks._common import print_table, use_service
+
+use_service('api')
+
+from aiohttp import ClientSession, web  # noqa: E402
+from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack  # noqa: E402
+from av import VideoFrame  # noqa: E402
+
+from app.rooms.workers import create_media_server  # noqa: E402
+
+
+FPS = 30
+
+
+def cpu_seconds(pid: int) -> float:
+    """utime + stime процесса из /proc/<pid>/stat"""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+class SyntheticVideo(VideoStreamTrack):
+    """Движущийся градиент, чтобы кодеку было что кодировать в каждом кадре"""
+
+    def __init__(self, width: int, height: int):
+        super().__init__()
+        self.image = np.tile(np.linspace(0, 255, width, dtype=np.uint8)[None, :, None], (height, 1, 3))
+        self.shift = 0
+
+    async def recv(self):
+        pts, time_base = await self.next_timestamp()
+        self.shift = (self.shift + 4) % self.image.shape[1]
+        frame = VideoFrame.from_ndarray(np.roll(self.image, self.shift, axis=1), format='bgr24')
+        frame.pts = pts
+        frame.time_base = time_base
+        return frame
+
+
+class Peer:
+    def __init__(self, width: int, height: int):
+        self.pc = RTCPeerConnection()
+        self.video = SyntheticVideo(width, height)
+        self.frames = 0
+        self.streams = 0
+        self._readers: list[asyncio.Task] = []
+
+        @self.pc.on('track')
+        def on_track(track):
+            self.streams += 1
+            self._readers.append(asyncio.create_task(self._read(track)))
+
+        @self.pc.on('datachannel')
+        def on_datachannel(channel):
+            @channel.on('message')
+            async def on_message(message):
+                data = json.loads(message)
+                if data.get('action') == 'renegotiating':
+                    await self.pc.setLocalDescription(await self.pc.createOffer())
+                    channel.send(json.dumps({'sdp': self.pc.localDescription.sdp, 'type': self.pc.localDescription.type}))
+                elif data.get('action') == 'answer':
+                    await self.pc.setRemoteDescription(RTCSessionDescription(sdp=data['sdp'], type=data['type']))
+
+    async def _read(self, track):
+        try:
+            while True:
+                await track.recv()
+                self.frames += 1
+        except Exception:
+            pass
+
+    async def join(self, session: ClientSession, url: str, room_id: str):
+        async with session.post(f'{url}/connect/{room_id}') as response:
+            offer = await response.json()
+        # Как в браузерном клиенте: трек добавляется до offer, транссивер получается sendrecv,
+        # и сервер потом отдаёт по нему видео собеседника
+        self.pc.addTrack(self.video)
+        await self.pc.setRemoteDescription(RTCSessionDescription(sdp=offer['sdp'], type=offer['type']))
+        await self.pc.setLocalDescription(await self.pc.createAnswer())
+        async with session.post(f'{url}/answer', json={
+            'id': offer['id'], 'room_id': room_id, 'sdp': self.pc.localDescription.sdp, 'type': self.pc.localDescription.type,
+        }) as response:
+            response.raise_for_status()
+
+    async def close(self):
+        for reader in self._readers:
+            reader.cancel()
+        await self.pc.close()
+
+
+async def run_clients(url: str, room_ids: list[str], peers_per_room: int, width: int, height: int, start_at: float, duration: float):
+    peers = []
+    async with ClientSession() as session:
+        for room_id in room_ids:
+            for _ in range(peers_per_room):
+                peer = Peer(width, height)
+                await peer.join(session, url, room_id)
+                peers.append(peer)
+
+    await asyncio.sleep(max(start_at - time.time(), 0))
+    frames_before = [peer.frames for peer in peers]
+    await asyncio.sleep(duration)
+    frames = sum(peer.frames - before for peer, before in zip(peers, frames_before))
+    streams = sum(1 for peer in peers for _ in range(peer.streams))
+
+    for peer in peers:
+        await peer.close()
+    return frames, streams
+
+
+def client_worker(args):
+    return asyncio.run(run_clients(*args))
+
+
+async def serve(media, port: int) -> web.AppRunner:
+    async def create_room(request):
+        await media.create_room(request.match_info['room_id'])
+        return web.json_response({})
+
+    async def connect(request):
+        return web.json_response(await media.connect(request.match_info['room_id']))
+
+    async def answer(request):
+        params = await request.json()
+        ok = await media.answer(params['room_id'], params['id'], params['sdp'], params['type'])
+        return web.json_response({}, status=200 if ok else 404)
+
+    app = web.Application()
+    app.router.add_post('/rooms/{room_id}', create_room)
+    app.router.add_post('/connect/{room_id}', connect)
+    app.router.add_post('/answer', answer)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner
+
+
+async def run_case(mode: str, rooms: int, args) -> dict:
+    workers = int(mode.split(':')[1]) if mode.startswith('workers') else 0
+    media = create_media_server(workers=workers)
+    await media.start()
+    runner = await serve(media, args.port)
+    url = f'http://127.0.0.1:{args.port}'
+
+    room_ids = [f'room-{i}' for i in range(rooms)]
+    async with ClientSession() as session:
+        for room_id in room_ids:
+            await session.post(f'{url}/rooms/{room_id}')
+
+    pids = [os.getpid()] + [worker.process.pid for worker in getattr(media, '_workers', [])]
+    start_at = time.time() + args.warmup
+    chunks = [room_ids[i::args.client_processes] for i in range(args.client_processes)]
+    jobs = [
+        (url, chunk, args.peers, args.width, args.height, start_at, args.duration)
+        for chunk in chunks if chunk
+    ]
+
+    loop = asyncio.get_running_loop()
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(len(jobs)) as pool:
+        results = pool.map_async(client_worker, jobs)
+
+        await asyncio.sleep(max(start_at - time.time(), 0))
+        cpu_before = sum(cpu_seconds(pid) for pid in pids)
+        await asyncio.sleep(args.duration)
+        server_cores = (sum(cpu_seconds(pid) for pid in pids) - cpu_before) / args.duration
+
+        frames, streams = map(sum, zip(*await loop.run_in_executor(None, results.get)))
+
+    await runner.cleanup()
+    await media.close()
+
+    expected = rooms * args.peers * (args.peers - 1)
+    fps = frames / (streams * args.duration) if streams else 0.0
+    return {
+        'mode': mode,
+        'rooms': rooms,
+        'streams': f'{streams}/{expected}',
+        'fps_per_stream': fps,
+        'server_cores': server_cores,
+        'rooms_per_core': rooms / server_cores if server_cores else 0.0,
+        'healthy': streams == expected and fps >= 0.9 * FPS,
+    }
+
+
+async def main(args):
+    rows = []
+    for mode in args.modes.split(','):
+        for rooms in map(int, args.rooms.split(',')):
+            rows.append(await run_case(mode, rooms, args))
+            print_table(rows[-1:])
+    print_table(rows, f'media rooms: {args.peers} peers per room, {args.width}x{args.height}@{FPS}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rooms', default='1,5,10,20')
+    parser.add_argument('--peers', type=int, default=2, help='участников в комнате')
+    parser.add_argument('--modes', default='inline,workers:2', help='inline или workers:N')
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--height', type=int, default=240)
+    parser.add_argument('--warmup', type=float, default=15, help='секунд на подключение клиентов до замера')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--client-processes', type=int, default=max(multiprocessing.cpu_count() - 1, 1))
+    parser.add_argument('--port', type=int, default=8765)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,74 @@
+"""
+Публикация в RabbitMQ: rabbit.publish с кэшем топологии против объявления
+exchange, очереди и привязки перед каждым сообщением (как было раньше).
+
+    cd backend && python -m benchmarks.publish --messages 5000 --concurrency 10
+
+Публикует в exchange bench и очередь bench.publish на брокере из .env, очередь удаляется в конце.
+"""
+import argparse
+import asyncio
+import time
+
+import aio_pika
+import msgpack
+from aio_pika import ExchangeType
+
+from benchmarks._common import latency_stats, print_table, use_service
+
+use_service('api')
+
+from common.storage import rabbit  # noqa: E402
+
+
+EXCHANGE = 'bench'
+QUEUE = 'bench.publish'
+
+
+async def publish_declaring(msg, queue_name: str, exchange_name: str):
+    async with rabbit.channel_pool.acquire() as channel:
+        exchange = await channel.declare_exchange(exchange_name, ExchangeType.DIRECT, durable=True)
+        queue = await channel.declare_queue(queue_name, durable=True)
+        await queue.bind(exchange, queue_name)
+        await exchange.publish(aio_pika.Message(msgpack.packb(msg)), queue_name)
+
+
+async def run(publish, messages: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    remaining = iter(range(messages))
+
+    async def publisher():
+        for i in remaining:
+            start = time.perf_counter()
+            await publish({'user_id': str(i), 'action': 'bench'}, QUEUE, EXCHANGE)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(publisher() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {'msgs_per_s': messages / elapsed, **latency_stats(latencies)}
+
+
+async def main(args):
+    modes = {'cached': rabbit.publish, 'declare': publish_declaring}
+    rows = []
+
+    # Прогрев: пулы соединений и каналов заполнены до замеров
+    await run(rabbit.publish, args.concurrency * 10, args.concurrency)
+
+    for mode in args.modes.split(','):
+        rows.append({'mode': mode, 'messages': args.messages, **await run(modes[mode], args.messages, args.concurrency)})
+
+    async with rabbit.channel_pool.acquire() as channel:
+        await channel.queue_delete(QUEUE)
+        await channel.exchange_delete(EXCHANGE)
+
+    print_table(rows, f'publish: concurrency {args.concurrency}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--modes', default='cached,declare')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,111 @@
+"""
+Погрешность и полнота int8-квантования индекса комнат (VECTOR_QUANTIZATION=int8).
+
+Сравниваются точный RoomIndex на float32 и квантованный RoomIndex:
+ошибка оценки сходства, recall@k без переранжирования и с переранжированием
+top_k * factor кандидатов по точным векторам (как VectorStorage._ranked),
+задержка поиска и память на комнату.
+
+    cd backend && python -m benchmarks.quantization --rooms 50000 --rerank 1,2,4,8
+
+Внешние сервисы не нужны.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks._common import latency_stats, print_table, random_unit_vectors, use_service
+
+use_service('api')
+
+from common.storage.redis import VectorStorage  # noqa: E402
+from common.storage.vector_index import RoomIndex  # noqa: E402
+from common.storage.vectors import dequantize_int8, quantize_int8  # noqa: E402
+
+
+FILTERS = {'gender': 'male', 'age': 25, 'country': 'RU'}
+
+
+def bytes_per_room(index: RoomIndex) -> float:
+    buckets = list(index._candidate_buckets(None, None, None))
+    allocated = sum(len(bucket) * (bucket.vectors.itemsize * bucket.vectors.shape[1] + (4 if bucket.quantized else 0)) for bucket in buckets)
+    return allocated / max(len(index), 1)
+
+
+def score_errors(vectors: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    restored = np.stack([dequantize_int8(*quantize_int8(vector)) for vector in vectors])
+    return np.abs(queries @ vectors.T - queries @ restored.T).ravel()
+
+
+def ranked(index: RoomIndex, vectors: dict, query: np.ndarray, top_k: int, threshold: float, factor: int) -> list[str]:
+    if factor == 0:
+        return [room_id for room_id, _ in index.search(query, top_k=top_k, similarity_threshold=threshold, **FILTERS)]
+
+    candidates = index.search(
+        query, top_k=top_k * factor, similarity_threshold=threshold - VectorStorage.QUANTIZATION_MARGIN, **FILTERS
+    )
+    scores = [(room_id, float(vectors[room_id] @ query)) for room_id, _ in candidates]
+    return [room_id for room_id, score in sorted(scores, key=lambda item: -item[1]) if score >= threshold][:top_k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rooms', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=312)
+    parser.add_argument('--clusters', type=int, default=256)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--threshold', type=float, default=0.6)
+    parser.add_argument('--rerank', default='1,2,4,8', help='множители кандидатов для переранжирования')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = random_unit_vectors(args.rooms, args.dim, rng, clusters=args.clusters)
+    room_ids = [f'room-{i}' for i in range(args.rooms)]
+    exact_vectors = dict(zip(room_ids, vectors))
+
+    exact = RoomIndex()
+    quantized = RoomIndex(quantized=True)
+    for room_id, vector in zip(room_ids, vectors):
+        exact.add(room_id, vector, **FILTERS)
+        quantized.add(room_id, vector, **FILTERS)
+
+    queries = vectors[rng.integers(args.rooms, size=args.queries)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    errors = score_errors(vectors[:min(args.rooms, 2000)], queries[:100])
+    print_table([{
+        'mean_abs_error': float(errors.mean()),
+        'p99_abs_error': float(np.percentile(errors, 99)),
+        'max_abs_error': float(errors.max()),
+        'margin': VectorStorage.QUANTIZATION_MARGIN,
+    }], 'score error, int8 vs float32')
+
+    truth = [ranked(exact, exact_vectors, query, args.top_k, args.threshold, 0) for query in queries]
+
+    rows = []
+    modes = [('float32', exact, 0), ('int8', quantized, 0)]
+    modes += [(f'int8+rerank x{factor}', quantized, factor) for factor in map(int, args.rerank.split(','))]
+    for name, index, factor in modes:
+        found, latencies = [], []
+        for query in queries:
+            start = time.perf_counter()
+            found.append(ranked(index, exact_vectors, query, args.top_k, args.threshold, factor))
+            latencies.append(time.perf_counter() - start)
+
+        pairs = [(set(f), set(t)) for f, t in zip(found, truth) if t]
+        rows.append({
+            'mode': name,
+            'recall': float(np.mean([len(f & t) / len(t) for f, t in pairs])) if pairs else 1.0,
+            'exact_order': float(np.mean([f == t for f, t in zip(found, truth)])),
+            'bytes_per_room': bytes_per_room(index),
+            **latency_stats(latencies),
+        })
+
+    print_table(rows, f'room search: {args.rooms} rooms, top-{args.top_k}, threshold {args.threshold}')
+
+
+if __name__ == '__main__':
+    main()
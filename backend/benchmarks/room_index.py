@@ -0,0 +1,132 @@
+"""
+Полнота и задержка поиска комнат: IVF-flat против точного RoomIndex (корзины, float32).
+
+Для каждого размера индекс заполняется одинаковыми комнатами, затем на одних и тех же
+запросах меряются recall@k относительно точного поиска, задержка и число просмотренных
+векторов. Наборы запросов: similar - похожие на комнаты, без фильтров; filtered - то же
+с фильтрами пол/возраст/страна, как у /initiate_connection; unrelated - случайные векторы,
+у которых обычно нет совпадений выше порога.
+
+    cd backend && python -m benchmarks.room_index --sizes 10000,100000,1000000 --nprobe 4,8,16
+
+Внешние сервисы не нужны. На 1M векторов размерности 312 нужно около 4 ГБ памяти.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks._common import latency_stats, print_table, random_unit_vectors, timer, use_service
+
+use_service('api')
+
+from common.storage.ann import IVFFlatIndex  # noqa: E402
+from common.storage.vector_index import RoomIndex  # noqa: E402
+
+
+GENDERS = np.array(['female', 'male'])
+COUNTRIES = np.array(['RU', 'KZ', 'BY', 'UZ', 'AM', 'GE', 'RS', 'DE', 'US', 'TR'])
+# Страны распределены неравномерно, как у реальной аудитории
+COUNTRY_WEIGHTS = np.array([0.55, 0.1, 0.08, 0.06, 0.05, 0.05, 0.04, 0.03, 0.02, 0.02])
+
+
+def make_rooms(n: int, dim: int, clusters: int, rng: np.random.Generator):
+    vectors = random_unit_vectors(n, dim, rng, clusters=clusters)
+    genders = GENDERS[rng.integers(2, size=n)]
+    ages = rng.integers(18, 61, size=n)
+    countries = COUNTRIES[rng.choice(len(COUNTRIES), size=n, p=COUNTRY_WEIGHTS)]
+    return vectors, genders, ages, countries
+
+
+def make_queries(rooms, count: int, kind: str, rng: np.random.Generator) -> list[dict]:
+    vectors, genders, ages, countries = rooms
+    if kind == 'unrelated':
+        return [{'query_vector': vector} for vector in random_unit_vectors(count, vectors.shape[1], rng)]
+
+    queries = []
+    for i in rng.integers(len(vectors), size=count):
+        # Запрос похож на существующую комнату, фильтры берутся у другой случайной комнаты
+        query = {'query_vector': vectors[i] + 0.3 * rng.standard_normal(vectors.shape[1]).astype(np.float32)}
+        if kind == 'filtered':
+            j = rng.integers(len(vectors))
+            query.update(gender=str(genders[j]), age=int(ages[j]), country=str(countries[j]))
+        queries.append(query)
+    return queries
+
+
+def run_queries(index, queries: list[dict], top_k: int, threshold: float) -> tuple[list[set], list[float], float]:
+    results, latencies, scanned = [], [], 0
+    for query in queries:
+        start = time.perf_counter()
+        found = index.search(top_k=top_k, similarity_threshold=threshold, **query)
+        latencies.append(time.perf_counter() - start)
+        scanned += index.last_scanned
+        results.append({room_id for room_id, _ in found})
+    return results, latencies, scanned / len(queries)
+
+
+def recall(found: list[set], exact: list[set]) -> float:
+    pairs = [(f, e) for f, e in zip(found, exact) if e]
+    if not pairs:
+        return 1.0
+    return float(np.mean([len(f & e) / len(e) for f, e in pairs]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--dim', type=int, default=312)
+    parser.add_argument('--clusters', type=int, default=256, help='кластеров в синтетических данных')
+    parser.add_argument('--nlist', type=int, default=64)
+    parser.add_argument('--nprobe', default='4,8,16')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--threshold', type=float, default=0.6, help='как в VectorStorage.claim_room')
+    args = parser.parse_args()
+
+    rows = []
+    for size in map(int, args.sizes.split(',')):
+        rng = np.random.default_rng(size)
+        rooms = make_rooms(size, args.dim, args.clusters, rng)
+        room_ids = [f'room-{i}' for i in range(size)]
+
+        exact_index = RoomIndex()
+        # train_size больше размера: обучаем один раз после заполнения, чтобы замерить время
+        ivf = IVFFlatIndex(nlist=args.nlist, train_size=size + 1)
+        for room_id, vector, gender, age, country in zip(room_ids, *rooms):
+            exact_index.add(room_id, vector, str(gender), int(age), str(country))
+            ivf.add(room_id, vector, str(gender), int(age), str(country))
+        with timer() as train_time:
+            ivf.train()
+
+        for kind in ('similar', 'filtered', 'unrelated'):
+            queries = make_queries(rooms, args.queries, kind, rng)
+            exact, latencies, scanned = run_queries(exact_index, queries, args.top_k, args.threshold)
+            rows.append({
+                'size': size,
+                'queries': kind,
+                'engine': 'bucket',
+                'recall': 1.0,
+                'avg_scanned': scanned,
+                **latency_stats(latencies),
+                'train_s': 0.0,
+            })
+
+            for nprobe in map(int, args.nprobe.split(',')):
+                ivf.nprobe = nprobe
+                found, latencies, scanned = run_queries(ivf, queries, args.top_k, args.threshold)
+                rows.append({
+                    'size': size,
+                    'queries': kind,
+                    'engine': f'ivf/{nprobe}',
+                    'recall': recall(found, exact),
+                    'avg_scanned': scanned,
+                    **latency_stats(latencies),
+                    'train_s': train_time(),
+                })
+
+    print_table(rows, f'room index: top-{args.top_k}, nlist {args.nlist}, {args.queries} queries')
+
+
+if __name__ == '__main__':
+    main()
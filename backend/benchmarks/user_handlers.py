@@ -0,0 +1,138 @@
+"""
+Задержка обработчиков пользователей pg_consumer до и после перехода на Core-запросы.
+
+before - прежние версии get_user, get_user_info и set_user_info: ORM-сессия,
+         загрузка целого объекта User, select-then-commit в set_user_info;
+after  - текущие обработчики из pg_consumer/handlers/users.py.
+
+Обе версии работают на одном движке (DB_POOL_MODE из .env) и вызываются без reply_to,
+так что меряется только работа с базой и сериализация ответа.
+
+    cd backend && python -m benchmarks.user_handlers --messages 2000 --concurrency 1
+
+Пользователи bench_user_* создаются в базе из .env и удаляются в конце.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks._common import latency_stats, print_table, use_service
+
+use_service('pg_consumer')
+
+from sqlalchemy import select  # noqa: E402
+
+from benchmarks._users import delete_users, seed_users  # noqa: E402
+from common.schemas.user import UserInfo, UserLogin  # noqa: E402
+from common.storage.database import async_session, engine  # noqa: E402
+from common.storage.models.user import User  # noqa: E402
+from common.storage.rabbit import send_answer  # noqa: E402
+from handlers.users import handle_event_get_user, handle_event_get_user_info, handle_event_set_user_info  # noqa: E402
+
+
+async def orm_get_user(body):
+    async with async_session() as db:
+        result = await db.execute(select(User).where(User.username == body.get('username')))
+        user = result.scalars().first()
+
+    serialized_data = {}
+    if user:
+        serialized_data = UserLogin.model_validate(user.__dict__).model_dump_json().encode('utf-8')
+    await send_answer(serialized_data, body.get('reply_to'), body.get('correlation_id'))
+
+
+async def orm_get_user_info(body):
+    async with async_session() as db:
+        result = await db.execute(select(User).where(User.id == body.get('user_id')))
+        user = result.scalars().first()
+
+    serialized_data = {}
+    if user:
+        serialized_data = UserInfo.model_validate(user.__dict__).model_dump_json().encode('utf-8')
+    await send_answer(serialized_data, body.get('reply_to'), body.get('correlation_id'))
+
+
+async def orm_set_user_info(body):
+    async with async_session() as db:
+        result = await db.execute(select(User).where(User.id == body.get('user_id')))
+        user = result.scalars().first()
+        if not user:
+            return
+
+        new_info = UserInfo.model_validate(body.get('new_info'))
+        for key, value in new_info.model_dump(exclude_unset=True).items():
+            setattr(user, key, value)
+        await db.commit()
+
+    serialized_data = UserInfo.model_validate(user.__dict__).model_dump_json().encode('utf-8')
+    await send_answer(serialized_data, body.get('reply_to'), body.get('correlation_id'))
+
+
+HANDLERS = {
+    'get_user': (orm_get_user, handle_event_get_user),
+    'get_user_info': (orm_get_user_info, handle_event_get_user_info),
+    'set_user_info': (orm_set_user_info, handle_event_set_user_info),
+}
+
+
+def make_body(action: str, user: dict) -> dict:
+    if action == 'set_user_info':
+        return {
+            'user_id': user['user_id'],
+            'new_info': {
+                'username': user['username'],
+                'is_male': random.random() < 0.5,
+                'birthdate': '1990-05-17',
+                'country': random.choice(['RU', 'KZ', 'BY']),
+                'description': 'Люблю походы, настолки и джаз',
+            },
+        }
+    return dict(user)
+
+
+async def run(handler, action: str, users: list[dict], count: int, concurrency: int) -> tuple[float, list[float]]:
+    latencies: list[float] = []
+    remaining = iter(range(count))
+
+    async def consumer():
+        for _ in remaining:
+            body = make_body(action, random.choice(users))
+            start = time.perf_counter()
+            await handler(body)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(consumer() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+
+async def main(args):
+    users = await seed_users(engine, args.users)
+    rows = []
+    try:
+        for action in args.handlers.split(','):
+            for version, handler in zip(('before', 'after'), HANDLERS[action]):
+                await run(handler, action, users, args.warmup, args.concurrency)
+                elapsed, latencies = await run(handler, action, users, args.messages, args.concurrency)
+                rows.append({
+                    'handler': action,
+                    'version': version,
+                    'msgs_per_s': args.messages / elapsed,
+                    **latency_stats(latencies),
+                })
+    finally:
+        await delete_users(engine)
+        await engine.dispose()
+
+    print_table(rows, f'user handlers: {args.messages} messages, concurrency {args.concurrency}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--handlers', default=','.join(HANDLERS))
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,92 @@
+"""
+Размер и время кодирования/декодирования вектора пользователя в разных форматах.
+
+    json    - список чисел в JSON (прежний ответ get_user)
+    msgpack - список чисел в msgpack
+    float32 - pack_vector/unpack_vector, сырые float32 байты (текущий формат)
+    int8    - quantize_int8 + масштаб, как комнаты в Redis при VECTOR_QUANTIZATION=int8
+
+    cd backend && python -m benchmarks.vector_payload --dim 312 --vectors 2000
+
+Внешние сервисы не нужны.
+"""
+import argparse
+import json
+import struct
+import time
+
+import msgpack
+import numpy as np
+
+from benchmarks._common import print_table, random_unit_vectors, use_service
+
+use_service('api')
+
+from common.storage.vectors import dequantize_int8, pack_vector, quantize_int8, unpack_vector  # noqa: E402
+
+
+def encode_int8(vector: np.ndarray) -> bytes:
+    codes, scale = quantize_int8(vector)
+    return struct.pack('<f', scale) + codes.tobytes()
+
+
+def decode_int8(data: bytes) -> np.ndarray:
+    return dequantize_int8(np.frombuffer(data, dtype=np.int8, offset=4), struct.unpack_from('<f', data)[0])
+
+
+FORMATS = {
+    'json': (
+        lambda vector: json.dumps(vector.tolist()).encode('utf-8'),
+        lambda data: np.asarray(json.loads(data), dtype=np.float32),
+    ),
+    'msgpack': (
+        lambda vector: msgpack.packb(vector.tolist()),
+        lambda data: np.asarray(msgpack.unpackb(data), dtype=np.float32),
+    ),
+    'float32': (pack_vector, unpack_vector),
+    'int8': (encode_int8, decode_int8),
+}
+
+
+def measure(encode, decode, vectors: np.ndarray, repeat: int) -> dict:
+    payloads = [encode(vector) for vector in vectors]
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for vector in vectors:
+            encode(vector)
+    encode_time = (time.perf_counter() - start) / (repeat * len(vectors))
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for data in payloads:
+            decode(data)
+    decode_time = (time.perf_counter() - start) / (repeat * len(vectors))
+
+    decoded = np.stack([decode(data) for data in payloads])
+    return {
+        'bytes': int(np.mean([len(data) for data in payloads])),
+        'encode_us': encode_time * 1e6,
+        'decode_us': decode_time * 1e6,
+        'max_abs_error': float(np.abs(decoded - vectors).max()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dim', type=int, default=312)
+    parser.add_argument('--vectors', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--formats', default=','.join(FORMATS))
+    args = parser.parse_args()
+
+    vectors = random_unit_vectors(args.vectors, args.dim, np.random.default_rng(0))
+    rows = [
+        {'format': name, **measure(*FORMATS[name], vectors, args.repeat)}
+        for name in args.formats.split(',')
+    ]
+    print_table(rows, f'vector payload: dim {args.dim}, {args.vectors} vectors')
+
+
+if __name__ == '__main__':
+    main()
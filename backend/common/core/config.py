@@ -1,3 +1,7 @@
+import socket
+from uuid import uuid4
+
+from pydantic import Field
 from pydantic_settings import BaseSettings
 
 
@@ -12,6 +16,13 @@ class Settings(BaseSettings):
     POSTGRES_DB: str
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
+    # 'pgbouncer' - пул держит PgBouncer, приложение открывает соединение на каждый запрос (NullPool);
+    # 'pool' - собственный пул соединений и кэш prepared statements asyncpg
+    DB_POOL_MODE: str = 'pgbouncer'
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_RECYCLE: int = 1800
+    DB_STATEMENT_CACHE_SIZE: int = 100
 
     RABBIT_HOST: str
     RABBIT_PORT: int
@@ -24,6 +35,10 @@ class Settings(BaseSettings):
     CLICKHOUSE_DB: str
     CLICKHOUSE_HTTP_PORT: int
     CLICKHOUSE_TCP_PORT: int
+    CLICKHOUSE_POOL_SIZE: int = 10
+    CLICKHOUSE_KEEPALIVE: float = 60
+    CLICKHOUSE_BATCH_ROWS: int = 500
+    CLICKHOUSE_BATCH_DELAY: float = 1
 
     REDIS_HOST: str
     REDIS_PORT: int
@@ -33,16 +48,55 @@ class Settings(BaseSettings):
     REDIS_POOL_MAXSIZE: int = 20
     REDIS_TIMEOUT: int = 5
 
+    ROOM_INDEX_ENGINE: str = 'bucket'
+    ROOM_INDEX_NLIST: int = 64
+    ROOM_INDEX_NPROBE: int = 8
+    ROOM_INDEX_SNAPSHOT: str | None = None
+    # 'int8' хранит комнаты в Redis и индексе квантованными, топ кандидатов переранжируется по float32.
+    # Экономит память (в 4 раза), поиск не быстрее float32
+    VECTOR_QUANTIZATION: str = 'none'
+    RERANK_FACTOR: int = 4
+
+    # 'redis' - общий реестр комнат для нескольких процессов/узлов API
+    ROOM_REGISTRY: str = 'local'
+    ROOM_TTL: int = 30
+    ROOM_HEARTBEAT: float = 10
+    NODE_ID: str = Field(default_factory=lambda: uuid4().hex)
+    # Адрес именно этого процесса: при ROOM_REGISTRY=redis у каждого воркера uvicorn свой порт
+    NODE_URL: str | None = None
+    # Общий секрет узлов API для пересылки подключений к комнатам; без него пересылка выключена
+    NODE_TOKEN: str | None = None
+    NODE_TIMEOUT: float = 5
+    # > 0 - WebRTC-подключения комнат обслуживают отдельные процессы-воркеры
+    MEDIA_WORKERS: int = 0
+
     MINIO_PORT: int
     MINIO_API_PORT: int
     MINIO_ENDPOINT: str
     MINIO_ROOT_USER: str
     MINIO_ROOT_PASSWORD: str
     MINIO_BUCKET: str
+    MINIO_WORKERS: int = 8
+    MINIO_PART_SIZE: int = 5 * 1024 * 1024
+    IMAGE_WORKERS: int = 2
 
-    USER_QUEUE: str = 'user.{user_id}'
     DB_QUEUE: str = 'user_db_ask'
     MODEL_QUEUE: str = 'user_click_ask'
+    RPC_TIMEOUT: float = 5
+    CONSUMER_CONCURRENCY: int = 10
+    CONSUMER_ORDERED: bool = True
+    HOBBIES_EXCHANGE: str = 'hobbies.changed'
+    HOBBY_CACHE_TTL: float = 300
+
+    EMBEDDING_BATCH_SIZE: int = 32
+    EMBEDDING_BATCH_DELAY_MS: float = 10
+    EMBEDDING_CACHE_SIZE: int = 10000
+    EMBEDDING_CACHE_REDIS: bool = True
+    EMBEDDING_CACHE_TTL: int = 30 * 24 * 60 * 60
+
+    USER_VECTOR_CACHE_SIZE: int = 10000
+    USER_VECTOR_LOCAL_TTL: float = 60
+    USER_VECTOR_TTL: int = 60 * 60
 
     SECRET_KEY: str = "asfdslknfsdfsdfjksdlkjfkjdsfjskjfsjdfndsfnkjfnskjfskjfskjfk"
     ALGORITHM: str = "HS256"
@@ -61,6 +115,10 @@ class Settings(BaseSettings):
     def clickhouse_http_url(self) -> str:
         return f"http://{self.CLICKHOUSE_HOST}:{self.CLICKHOUSE_HTTP_PORT}"
 
+    @property
+    def node_url(self) -> str:
+        return self.NODE_URL or f"http://{socket.gethostname()}:{self.FASTAPI_PORT}"
+
     @property
     def redis_url(self) -> str:
         return f"redis://:{self.REDIS_PASSWORD}@{self.REDIS_HOST}:{self.REDIS_PORT}/{self.REDIS_DB}"
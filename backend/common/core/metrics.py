@@ -0,0 +1,25 @@
+from bisect import bisect_left
+
+
+class Histogram:
+    """Простая гистограмма с фиксированными границами корзин"""
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def snapshot(self) -> dict:
+        buckets = {f'le_{bound}': count for bound, count in zip(self.bounds, self.counts)}
+        buckets['inf'] = self.counts[-1]
+        return {
+            'count': self.count,
+            'avg': self.total / self.count if self.count else 0.0,
+            'buckets': buckets,
+        }
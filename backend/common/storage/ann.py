@@ -0,0 +1,388 @@
+import asyncio
+import numpy as np
+from typing import List, Optional, Tuple
+
+from common.storage.vector_index import AGE_WINDOW, RoomIndex
+from common.storage.vectors import normalize
+from logger import logger
+
+
+GENDER_CODES = {"female": 0, "male": 1}
+
+
+class InvertedList:
+    """Векторы одного кластера IVF с метаданными в параллельных массивах"""
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.genders = np.full(capacity, -1, dtype=np.int8)
+        self.ages = np.zeros(capacity, dtype=np.int16)
+        self.countries = np.full(capacity, -1, dtype=np.int32)
+        self.room_ids: List[str] = []
+        self.rows: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.room_ids)
+
+    def _grow(self):
+        capacity = self.vectors.shape[0] * 2
+        vectors = np.zeros((capacity, self.vectors.shape[1]), dtype=np.float32)
+        vectors[:len(self)] = self.vectors[:len(self)]
+        self.vectors = vectors
+        self.genders = np.resize(self.genders, capacity)
+        self.ages = np.resize(self.ages, capacity)
+        self.countries = np.resize(self.countries, capacity)
+
+    def add(self, room_id: str, vector: np.ndarray, gender: int, age: int, country: int):
+        row = len(self.room_ids)
+        if row == self.vectors.shape[0]:
+            self._grow()
+        self.vectors[row] = vector
+        self.genders[row] = gender
+        self.ages[row] = age
+        self.countries[row] = country
+        self.rows[room_id] = row
+        self.room_ids.append(room_id)
+
+    def remove(self, room_id: str):
+        row = self.rows.pop(room_id)
+
+        last = len(self.room_ids) - 1
+        last_id = self.room_ids.pop()
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.genders[row] = self.genders[last]
+            self.ages[row] = self.ages[last]
+            self.countries[row] = self.countries[last]
+            self.room_ids[row] = last_id
+            self.rows[last_id] = row
+
+    @classmethod
+    def from_arrays(cls, room_ids: List[str], vectors: np.ndarray, genders: np.ndarray, ages: np.ndarray, countries: np.ndarray) -> 'InvertedList':
+        n = len(room_ids)
+        inverted = cls(vectors.shape[1], capacity=max(64, n))
+        inverted.vectors[:n] = vectors
+        inverted.genders[:n] = genders
+        inverted.ages[:n] = ages
+        inverted.countries[:n] = countries
+        inverted.room_ids = list(room_ids)
+        inverted.rows = {room_id: row for row, room_id in enumerate(inverted.room_ids)}
+        return inverted
+
+    def row(self, room_id: str) -> tuple:
+        row = self.rows[room_id]
+        return self.vectors[row], int(self.genders[row]), int(self.ages[row]), int(self.countries[row])
+
+    def scores(self, query: np.ndarray, gender: int | None, age: int | None, country: int | None) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """
+        Сходство с запросом только для строк, прошедших фильтры.
+        Возвращает (номера строк или None, если фильтров нет, оценки)
+        """
+        n = len(self.room_ids)
+        mask = None
+        if gender is not None:
+            mask = self.genders[:n] == gender
+        if age is not None:
+            in_window = np.abs(self.ages[:n].astype(np.int32) - age) <= AGE_WINDOW
+            mask = in_window if mask is None else mask & in_window
+        if country is not None:
+            same_country = self.countries[:n] == country
+            mask = same_country if mask is None else mask & same_country
+
+        if mask is None:
+            return None, self.vectors[:n] @ query
+        rows = np.flatnonzero(mask)
+        return rows, self.vectors[rows] @ query
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Сферический k-means: центроиды нормированы, близость - скалярное произведение"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(k):
+            members = vectors[assignment == c]
+            if len(members):
+                centroids[c] = normalize(members.sum(axis=0))
+            else:
+                # Пустой кластер перезапускаем со случайной точки
+                centroids[c] = vectors[rng.integers(len(vectors))]
+    return centroids
+
+
+def build_lists(centroids: Optional[np.ndarray], room_ids: List[str], vectors: np.ndarray, genders: np.ndarray, ages: np.ndarray, countries: np.ndarray) -> Tuple[List[InvertedList], dict[str, int]]:
+    """Раскладывает векторы по спискам целыми срезами, без поштучного add"""
+    if centroids is None:
+        assignment = np.zeros(len(vectors), dtype=np.int64)
+    else:
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+
+    room_ids = np.asarray(room_ids, dtype=object)
+    lists = []
+    for list_no in range(1 if centroids is None else len(centroids)):
+        rows = np.flatnonzero(assignment == list_no)
+        lists.append(InvertedList.from_arrays(room_ids[rows].tolist(), vectors[rows], genders[rows], ages[rows], countries[rows]))
+    return lists, {room_id: int(list_no) for room_id, list_no in zip(room_ids.tolist(), assignment.tolist())}
+
+
+class IVFFlatIndex:
+    """
+    Приближённый поиск IVF-flat: векторы разбиты на nlist кластеров,
+    запрос сравнивается только с векторами из nprobe ближайших кластеров.
+    До накопления train_size векторов работает как точный поиск.
+    Переобучение при росте индекса идёт в отдельном потоке, поиск тем временем
+    работает по старым спискам
+    """
+
+    def __init__(self, nlist: int = 64, nprobe: int = 8, train_size: int = 4096, train_sample: int = 256):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size
+        # k-means обучается не более чем на train_sample точках на кластер
+        self.train_sample = train_sample
+
+        self._dim: Optional[int] = None
+        self._centroids: Optional[np.ndarray] = None
+        self._trained_size = 0
+        self._lists: List[InvertedList] = []
+        self._keys: dict[str, int] = {}
+        self._country_codes: dict[str, int] = {}
+
+        self._training: Optional[asyncio.Task] = None
+        # Комнаты, изменённые во время фонового обучения, и номер поколения содержимого
+        self._dirty: set[str] = set()
+        self._generation = 0
+
+        self.queries = 0
+        self.scanned = 0
+        self.last_scanned = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, room_id: str) -> bool:
+        return room_id in self._keys
+
+    def _country_code(self, country: Optional[str]) -> int:
+        if country is None:
+            return -1
+        return self._country_codes.setdefault(country, len(self._country_codes))
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        if self._centroids is None:
+            return np.zeros(len(vectors), dtype=np.int64)
+        return np.argmax(vectors @ self._centroids.T, axis=1)
+
+    def _rows(self):
+        for inverted in self._lists:
+            n = len(inverted)
+            yield (
+                inverted.room_ids,
+                inverted.vectors[:n],
+                inverted.genders[:n],
+                inverted.ages[:n],
+                inverted.countries[:n],
+            )
+
+    def _rebuild(self, room_ids, vectors, genders, ages, countries):
+        self._lists, self._keys = build_lists(self._centroids, room_ids, vectors, genders, ages, countries)
+
+    def _snapshot(self) -> tuple:
+        parts = list(zip(*self._rows()))
+        room_ids = [room_id for ids in parts[0] for room_id in ids]
+        return (room_ids, *(np.concatenate(part) for part in parts[1:]))
+
+    def _fit(self, room_ids, vectors, genders, ages, countries) -> tuple:
+        """Обучение на копии данных: не трогает состояние индекса, поэтому может идти в другом потоке"""
+        sample = vectors
+        limit = self.train_sample * self.nlist
+        if len(vectors) > limit:
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), size=limit, replace=False)]
+
+        centroids = kmeans(sample, min(self.nlist, len(sample)))
+        return centroids, *build_lists(centroids, room_ids, vectors, genders, ages, countries)
+
+    def train(self):
+        """Обучает кластеры на текущих векторах и раскладывает их заново"""
+        if not self._keys:
+            return
+        snapshot = self._snapshot()
+        self._centroids, self._lists, self._keys = self._fit(*snapshot)
+        self._trained_size = len(snapshot[0])
+
+    async def _train_background(self):
+        generation = self._generation
+        snapshot = self._snapshot()
+        self._dirty = set()
+        try:
+            centroids, lists, keys = await asyncio.to_thread(self._fit, *snapshot)
+        except Exception:
+            logger.exception('Room index training failed')
+            return
+        finally:
+            self._training = None
+
+        if generation != self._generation:
+            # Индекс очищен или перезагружен, пока шло обучение
+            return
+
+        # Переносим изменения, сделанные во время обучения, и подменяем списки разом
+        for room_id in self._dirty:
+            list_no = keys.pop(room_id, None)
+            if list_no is not None:
+                lists[list_no].remove(room_id)
+
+            old_list_no = self._keys.get(room_id)
+            if old_list_no is not None:
+                vector, gender, age, country = self._lists[old_list_no].row(room_id)
+                list_no = int(np.argmax(centroids @ vector))
+                lists[list_no].add(room_id, vector, gender, age, country)
+                keys[room_id] = list_no
+        self._dirty = set()
+
+        self._centroids, self._lists, self._keys = centroids, lists, keys
+        self._trained_size = len(snapshot[0])
+
+    def _maybe_train(self):
+        # Переобучаемся при первом наборе данных и затем при росте в 4 раза
+        size = len(self._keys)
+        if self._training is not None or size < self.train_size or size < 4 * self._trained_size:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне event loop (скрипты, бенчмарки) обучаемся синхронно
+            self.train()
+            return
+        self._training = asyncio.create_task(self._train_background())
+
+    def add(self, room_id: str, vector: np.ndarray, gender: Optional[str], age: int, country: Optional[str]):
+        vector = normalize(vector)
+        if self._dim is None:
+            self._dim = vector.shape[0]
+            self._lists = [InvertedList(self._dim)]
+
+        self.remove(room_id)
+        list_no = int(self._assign(vector[None, :])[0])
+        self._lists[list_no].add(room_id, vector, GENDER_CODES.get(gender, -1), int(age), self._country_code(country))
+        self._keys[room_id] = list_no
+        if self._training is not None:
+            self._dirty.add(room_id)
+
+        self._maybe_train()
+
+    def remove(self, room_id: str):
+        list_no = self._keys.pop(room_id, None)
+        if list_no is not None:
+            self._lists[list_no].remove(room_id)
+            if self._training is not None:
+                self._dirty.add(room_id)
+
+    def clear(self):
+        """Удаляет все комнаты, обученные кластеры сохраняются"""
+        self._lists = [InvertedList(self._dim) for _ in self._lists]
+        self._keys.clear()
+        self._generation += 1
+
+    def search(
+        self,
+        query_vector: np.ndarray,
+        top_k: int = 3,
+        similarity_threshold: float = 0.6,
+        gender: Optional[str] = None,
+        age: Optional[int] = None,
+        country: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """Возвращает до top_k пар (room_id, similarity), отсортированных по убыванию сходства"""
+        self.queries += 1
+        self.last_scanned = 0
+        if not self._keys:
+            return []
+
+        country_code = None
+        if country is not None:
+            country_code = self._country_codes.get(country)
+            if country_code is None:
+                return []
+        gender_code = GENDER_CODES.get(gender, -1) if gender is not None else None
+
+        query = normalize(query_vector)
+        order = [0] if self._centroids is None else np.argsort(-(self._centroids @ query))
+
+        # Пробуем nprobe ближайших кластеров. С фильтрами подходящих комнат в них может быть мало:
+        # идём дальше, пока подходящих строк не наберётся столько же, сколько просмотрел бы
+        # поиск без фильтров. Число найденных комнат на остановку не влияет, иначе запрос
+        # без совпадений выше порога просматривал бы весь индекс
+        filtered = gender is not None or age is not None or country is not None
+        budget = len(self._keys) * self.nprobe / len(self._lists) if filtered else 0
+        results: List[Tuple[str, float]] = []
+        for probed, list_no in enumerate(order):
+            if probed >= self.nprobe and self.last_scanned >= budget:
+                break
+            inverted = self._lists[list_no]
+            if not len(inverted):
+                continue
+            rows, scores = inverted.scores(query, gender_code, age, country_code)
+            self.last_scanned += len(scores)
+
+            candidates = np.flatnonzero(scores >= similarity_threshold)
+            if candidates.size > top_k:
+                candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+            results.extend(
+                (inverted.room_ids[i if rows is None else rows[i]], float(scores[i])) for i in candidates
+            )
+
+        self.scanned += self.last_scanned
+        return sorted(results, key=lambda item: -item[1])[:top_k]
+
+    def save(self, path: str):
+        """Сохраняет центроиды и содержимое индекса в .npz"""
+        parts = list(zip(*self._rows())) if self._keys else None
+        np.savez(
+            path,
+            centroids=self._centroids if self._centroids is not None else np.zeros((0, 0), dtype=np.float32),
+            trained_size=self._trained_size,
+            room_ids=np.array([room_id for ids in parts[0] for room_id in ids] if parts else [], dtype=str),
+            vectors=np.concatenate(parts[1]) if parts else np.zeros((0, self._dim or 0), dtype=np.float32),
+            genders=np.concatenate(parts[2]) if parts else np.zeros(0, dtype=np.int8),
+            ages=np.concatenate(parts[3]) if parts else np.zeros(0, dtype=np.int16),
+            countries=np.concatenate(parts[4]) if parts else np.zeros(0, dtype=np.int32),
+            country_names=np.array(list(self._country_codes), dtype=str),
+        )
+
+    def load(self, path: str):
+        data = np.load(path)
+        self._generation += 1
+        centroids = data['centroids']
+        self._centroids = centroids if centroids.size else None
+        self._trained_size = int(data['trained_size'])
+        self._country_codes = {str(name): code for code, name in enumerate(data['country_names'])}
+
+        vectors = data['vectors']
+        self._dim = vectors.shape[1] if vectors.size else (centroids.shape[1] if centroids.size else None)
+        if self._dim is not None:
+            self._rebuild([str(room_id) for room_id in data['room_ids']], vectors, data['genders'], data['ages'], data['countries'])
+
+    def stats(self) -> dict:
+        return {
+            "engine": "ivf",
+            "rooms": len(self._keys),
+            "lists": len(self._lists),
+            "trained": self._centroids is not None,
+            "training": self._training is not None,
+            "queries": self.queries,
+            "last_scanned": self.last_scanned,
+            "avg_scanned": self.scanned / self.queries if self.queries else 0.0,
+        }
+
+
+def create_index(engine: str, **kwargs):
+    """Создаёт индекс комнат: 'bucket' - поиск по корзинам, 'ivf' - приближённый IVF-flat"""
+    match engine:
+        case 'bucket':
+            return RoomIndex(**kwargs)
+        case 'ivf':
+            return IVFFlatIndex(**kwargs)
+    raise ValueError(f'Unknown room index engine: {engine}')
@@ -10,14 +10,36 @@ client = clickhouse_connect.get_client(
     database=settings.CLICKHOUSE_DB
 )
 
-client.command('''
-CREATE TABLE IF NOT EXISTS user_vectors (
+# Версионированная схема: обновление - это просто новая строка с большим updated_at,
+# старые версии схлопываются при слиянии, а чтения идут через FINAL
+USER_VECTORS_DDL = '''
+CREATE TABLE IF NOT EXISTS {table} (
     userid UUID,
-    vector Array(Float32)
-) ENGINE = MergeTree()
+    vector Array(Float32),
+    updated_at DateTime64(3) DEFAULT now64(3)
+) ENGINE = ReplacingMergeTree(updated_at)
 ORDER BY userid
+'''
+
+client.command(USER_VECTORS_DDL.format(table='user_vectors'))
+
+engine = client.command('''
+SELECT engine FROM system.tables
+WHERE database = currentDatabase() AND name = 'user_vectors'
 ''')
 
+if engine == 'MergeTree':
+    # Таблица старой схемы: переносим данные и атомарно подменяем её новой
+    client.command('DROP TABLE IF EXISTS user_vectors_new')
+    client.command(USER_VECTORS_DDL.format(table='user_vectors_new'))
+    client.command('''
+    INSERT INTO user_vectors_new (userid, vector)
+    SELECT userid, vector FROM user_vectors
+    ''')
+    client.command('EXCHANGE TABLES user_vectors AND user_vectors_new')
+    client.command('DROP TABLE user_vectors_new')
+    print("Таблица user_vectors переведена на ReplacingMergeTree(updated_at)")
+
 try:
     client.command('''
     ALTER TABLE user_vectors
@@ -1,76 +1,296 @@
+import asyncio
+import json
+import struct
+import time
 import numpy as np
-from random import choice
+from uuid import UUID
 from aiochclient import ChClient
-from aiohttp import ClientSession
+from aiohttp import ClientSession, TCPConnector
 from common.core.config import settings
+from common.core.metrics import Histogram
+from common.storage.vectors import VECTOR_DTYPE, normalize
+from logger import logger
 
 
-def normalize(vec):
-    vec = np.array(vec, dtype=np.float32)
-    norm = np.linalg.norm(vec)
-    if norm == 0:
-        return vec.tolist()
-    return (vec / norm).tolist()
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def encode_uuid(userid: str) -> bytes:
+    # В RowBinary UUID - две UInt64 в little-endian: сначала старшая половина, потом младшая
+    raw = UUID(str(userid)).bytes
+    return raw[7::-1] + raw[:7:-1]
+
+
+def decode_vector(data: bytes) -> np.ndarray | None:
+    """Первое значение Array(Float32) из ответа в формате RowBinary"""
+    if not data:
+        return None
+    length, shift, offset = 0, 0, 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        length |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            break
+    return np.frombuffer(data, dtype=VECTOR_DTYPE, count=length, offset=offset)
+
+
+def encode_vector_row(userid: str, vector: np.ndarray, updated_at_ms: int) -> bytes:
+    """Строка user_vectors (userid UUID, vector Array(Float32), updated_at DateTime64(3)) в формате RowBinary"""
+    vector = np.asarray(vector, dtype=VECTOR_DTYPE)
+    return (
+        encode_uuid(userid)
+        + _varint(vector.shape[0])
+        + vector.tobytes()
+        + struct.pack('<q', updated_at_ms)
+    )
+
+
+class VectorWriteBuffer:
+    """
+    Копит строки user_vectors и вставляет их одним INSERT ... FORMAT RowBinary
+    по достижении max_rows или через max_delay секунд после первой строки
+    """
+
+    def __init__(
+        self,
+        client: 'ClickHouseAsyncClient',
+        max_rows: int = settings.CLICKHOUSE_BATCH_ROWS,
+        max_delay: float = settings.CLICKHOUSE_BATCH_DELAY
+    ):
+        self.client = client
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+
+        # Для каждого пользователя в буфере хранится только последний вектор и его версия
+        self._rows: dict[str, tuple[np.ndarray, int]] = {}
+        self._timer: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rows_per_flush = Histogram((1, 10, 50, 100, 500, 1000, 5000))
+        self.flush_latency_ms = Histogram((5, 10, 25, 50, 100, 250, 500, 1000))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    async def add(self, userid: str, vector):
+        self._rows[str(userid)] = (normalize(vector), time.time_ns() // 1_000_000)
+
+        if len(self._rows) >= self.max_rows:
+            await self.flush()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
+        # Таймер отработал: без этого неудачный flush не смог бы запланировать повтор
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception('Failed to flush user_vectors buffer')
+
+    async def flush(self):
+        async with self._lock:
+            if not self._rows:
+                return
+
+            rows, self._rows = self._rows, {}
+            payload = b''.join(
+                encode_vector_row(userid, vector, updated_at) for userid, (vector, updated_at) in rows.items()
+            )
+
+            started = time.perf_counter()
+            try:
+                await self.client.insert_raw(
+                    'INSERT INTO user_vectors (userid, vector, updated_at) FORMAT RowBinary', payload
+                )
+            except Exception:
+                self.failed_flushes += 1
+                # Возвращаем строки в буфер, не затирая более свежие векторы
+                self._rows = {**rows, **self._rows}
+                if self._timer is None or self._timer.done():
+                    self._timer = asyncio.create_task(self._flush_later())
+                raise
+
+            self.flushes += 1
+            self.rows_per_flush.observe(len(rows))
+            self.flush_latency_ms.observe((time.perf_counter() - started) * 1000)
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            'pending': len(self._rows),
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+            'rows_per_flush': self.rows_per_flush.snapshot(),
+            'flush_latency_ms': self.flush_latency_ms.snapshot(),
+        }
+
 
 class ClickHouseAsyncClient:
-    def __init__(self):
+    """
+    Долгоживущий клиент ClickHouse с общим пулом keep-alive соединений.
+    Создаётся один раз на процесс: start() при запуске, close() при остановке
+    """
+
+    def __init__(
+        self,
+        pool_size: int = settings.CLICKHOUSE_POOL_SIZE,
+        keepalive: float = settings.CLICKHOUSE_KEEPALIVE
+    ):
+        self.pool_size = pool_size
+        self.keepalive = keepalive
         self.session = None
         self.client = None
 
-    async def __aenter__(self):
-        self.session = ClientSession()
-        self.client = ChClient(
-            self.session,
-            url=settings.clickhouse_http_url,
-            user=settings.CLICKHOUSE_USER,
-            password=settings.CLICKHOUSE_PASSWORD,
-            database=settings.CLICKHOUSE_DB
-        )
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.errors = 0
+        self.latency_ms = Histogram((1, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+        self.vector_buffer = VectorWriteBuffer(self)
+
+    async def start(self):
+        if self.session is None or self.session.closed:
+            self.session = ClientSession(
+                connector=TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive)
+            )
+            self.client = ChClient(
+                self.session,
+                url=settings.clickhouse_http_url,
+                user=settings.CLICKHOUSE_USER,
+                password=settings.CLICKHOUSE_PASSWORD,
+                database=settings.CLICKHOUSE_DB
+            )
         return self
 
+    async def close(self):
+        await self.vector_buffer.close()
+        if self.session is not None:
+            await self.session.close()
+        self.session = self.client = None
+
+    async def __aenter__(self):
+        return await self.start()
+
     async def __aexit__(self, exc_type, exc, tb):
-        await self.session.close()
+        # Соединения остаются в пуле до close()
+        pass
+
+    async def _timed(self, awaitable):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.latency_ms.observe((time.perf_counter() - started) * 1000)
+
+    async def execute(self, query: str, *args, **kwargs):
+        await self.start()
+        return await self._timed(self.client.execute(query, *args, **kwargs))
+
+    async def fetch(self, query: str, *args, **kwargs):
+        await self.start()
+        return await self._timed(self.client.fetch(query, *args, **kwargs))
+
+    async def _request(self, query: str, payload: bytes | None = None, params: dict | None = None) -> bytes:
+        query_params = {'query': query, 'database': settings.CLICKHOUSE_DB}
+        for name, value in (params or {}).items():
+            query_params[f'param_{name}'] = str(value)
+
+        async with self.session.post(
+            settings.clickhouse_http_url,
+            params=query_params,
+            headers={
+                'X-ClickHouse-User': settings.CLICKHOUSE_USER,
+                'X-ClickHouse-Key': settings.CLICKHOUSE_PASSWORD,
+            },
+            data=payload,
+        ) as response:
+            body = await response.read()
+            if response.status != 200:
+                raise RuntimeError(f'ClickHouse query failed: {body.decode(errors="replace")}')
+            return body
+
+    async def insert_raw(self, query: str, payload: bytes):
+        """Отправляет уже закодированные данные (RowBinary и т.п.) телом запроса"""
+        await self.start()
+        await self._timed(self._request(query, payload))
+
+    async def fetch_raw(self, query: str, params: dict | None = None) -> bytes:
+        """Возвращает ответ как есть, без разбора в Python-объекты (для FORMAT RowBinary)"""
+        await self.start()
+        return await self._timed(self._request(query, params=params))
+
+    def stats(self) -> dict:
+        return {
+            'pool_size': self.pool_size,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'errors': self.errors,
+            'latency_ms': self.latency_ms.snapshot(),
+            'vector_buffer': self.vector_buffer.stats(),
+        }
 
     async def insert_vector(self, data):
-        data['vector'] = normalize(data['vector'])
-        query = "INSERT INTO user_vectors (userid, vector) FORMAT JSONEachRow"
-        await self.client.execute(query, data)
+        await self.vector_buffer.add(data['userid'], data['vector'])
 
     async def update_vector(self, userid: str, new_vector: list):
-        await self.client.execute(
-            f"ALTER TABLE user_vectors DELETE WHERE userid = '{userid}'"
-        )
+        # ReplacingMergeTree(updated_at): новая версия строки вытеснит старую при слиянии
         await self.insert_vector({"userid": userid, "vector": new_vector})
 
     async def get_vector_by_userid(self, userid):
-        sql = f"SELECT vector FROM user_vectors WHERE userid = '{userid}'"
-        result = await self.client.fetch(sql)
-        return result[0]["vector"] if result else None
-
-    async def get_neighbor(self, userid, threshold=0.5):
-        sql_get_vector = f"SELECT vector FROM user_vectors WHERE userid = '{userid}'"
-        result = await self.client.fetch(sql_get_vector)
-
-        if not result:
-            return None
-
-        user_vector = result[0]["vector"]
-        query_vec = normalize(user_vector)
-        vector_str = "[" + ",".join(map(str, query_vec)) + "]"
-
-        sql = f'''
-        SELECT 
-            userid, 
-            vector,
-            1 - arraySum(arrayMap((x, y) -> x * y, vector, {vector_str})) AS distance
-        FROM user_vectors
-        WHERE 
-            knnMatch(vector, {vector_str}, 'knn_index', 10) AND 
-            userid != '{userid}'
-        HAVING distance <= {threshold}
+        sql = "SELECT vector FROM user_vectors FINAL WHERE userid = {userid:UUID} FORMAT RowBinary"
+        return decode_vector(await self.fetch_raw(sql, params={'userid': userid}))
+
+    async def get_neighbor(self, userid, threshold=0.5, top_k=5) -> list[dict]:
+        """
+        Ближайшие к пользователю векторы одним запросом:
+        вектор самого пользователя берётся подзапросом на сервере.
+        Возвращает до top_k записей {'userid', 'score'} по убыванию сходства
+        """
+        sql = '''
+        WITH (
+            SELECT vector FROM user_vectors FINAL WHERE userid = {userid:UUID}
+        ) AS target
+        SELECT
+            userid,
+            cosineDistance(vector, target) AS distance
+        FROM user_vectors FINAL
+        WHERE
+            userid != {userid:UUID} AND
+            length(vector) = length(target) AND
+            distance <= {threshold:Float32}
         ORDER BY distance ASC
-        LIMIT 5
+        LIMIT {top_k:UInt32}
+        FORMAT JSONEachRow
         '''
-        
-        result = await self.client.fetch(sql)
-        return choice(result) if result else None
+
+        # Параметры {name:Type} подставляет сервер, поэтому запрос идёт через fetch_raw, а не через aiochclient
+        body = await self.fetch_raw(
+            sql, params={'userid': userid, 'threshold': threshold, 'top_k': top_k}
+        )
+        rows = (json.loads(line) for line in body.splitlines() if line)
+        return [{'userid': row['userid'], 'score': 1 - row['distance']} for row in rows]
+
+clickhouse = ClickHouseAsyncClient()
@@ -13,14 +13,30 @@ class CConnection(Connection):
         return f'__asyncpg_{prefix}_{uuid4()}__'
 
 
-def create_engine() -> AsyncEngine:
-    return create_async_engine(
-        settings.db_url,
-        poolclass=NullPool,
-        connect_args={
-            'connection_class': CConnection,
-        },
-    )
+def create_engine(mode: str = settings.DB_POOL_MODE) -> AsyncEngine:
+    match mode:
+        case 'pgbouncer':
+            # Уникальные имена prepared statements не конфликтуют на разделяемых PgBouncer'ом соединениях
+            return create_async_engine(
+                settings.db_url,
+                poolclass=NullPool,
+                connect_args={
+                    'connection_class': CConnection,
+                },
+            )
+        case 'pool':
+            return create_async_engine(
+                settings.db_url,
+                pool_size=settings.DB_POOL_SIZE,
+                max_overflow=settings.DB_MAX_OVERFLOW,
+                pool_recycle=settings.DB_POOL_RECYCLE,
+                pool_pre_ping=True,
+                connect_args={
+                    'statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE,
+                    'prepared_statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE,
+                },
+            )
+    raise ValueError(f'Unknown database pool mode: {mode}')
 
 
 def create_session(_engine: AsyncEngine) -> async_sessionmaker[AsyncSession]:
@@ -1,7 +1,12 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, BinaryIO, Optional
+
 from minio import Minio
 from minio.error import S3Error
 from common.core.config import settings
-from io import BytesIO
+from logger import logger
 
 
 minio_client = Minio(
@@ -11,25 +16,88 @@ minio_client = Minio(
     secure=False,
 )
 
+# Клиент minio синхронный - все вызовы уходят в отдельный пул потоков, чтобы не блокировать event loop
+_executor = ThreadPoolExecutor(max_workers=settings.MINIO_WORKERS, thread_name_prefix='minio')
+
+
+async def _run(func, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(_executor, partial(func, *args, **kwargs))
+
+
+async def ensure_bucket():
+    """Создаёт бакет, если его нет; вызывается один раз при старте"""
+    if not await _run(minio_client.bucket_exists, settings.MINIO_BUCKET):
+        await _run(minio_client.make_bucket, settings.MINIO_BUCKET)
 
-async def upload_image(filename, image_bytes):
+
+async def object_exists(name: str) -> bool:
     try:
-        if not minio_client.bucket_exists(settings.MINIO_BUCKET):
-            minio_client.make_bucket(settings.MINIO_BUCKET)
+        await _run(minio_client.stat_object, settings.MINIO_BUCKET, name)
+        return True
+    except S3Error as e:
+        if e.code in ('NoSuchKey', 'NoSuchObject'):
+            return False
+        raise
 
-        minio_client.put_object(
-            bucket_name=settings.MINIO_BUCKET, object_name=filename, data=BytesIO(image_bytes), length=len(image_bytes)
+
+async def upload_image(filename: str, data: BinaryIO, length: int = -1, content_type: str = 'application/octet-stream'):
+    """
+    Загружает файл потоком: при неизвестной длине (-1) minio отправляет его
+    multipart-частями по MINIO_PART_SIZE, не читая целиком в память.
+    Ошибку MinIO пробрасывает (S3Error), чтобы вызывающий не считал объект загруженным
+    """
+    try:
+        await _run(
+            minio_client.put_object,
+            bucket_name=settings.MINIO_BUCKET,
+            object_name=filename,
+            data=data,
+            length=length,
+            part_size=settings.MINIO_PART_SIZE if length < 0 else 0,
+            content_type=content_type or 'application/octet-stream',
         )
-        print(f"File {filename} uploaded to bucket {settings.MINIO_BUCKET}.")
+    except S3Error as e:
+        logger.error(f"Failed to upload {filename}: {e}")
+        raise
+    logger.info(f"File {filename} uploaded to bucket {settings.MINIO_BUCKET}.")
+
 
+async def get_image(filename: str) -> Optional[bytes]:
+    def read():
+        response = minio_client.get_object(settings.MINIO_BUCKET, filename)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    try:
+        return await _run(read)
     except S3Error as e:
-        print(f"Error occurred: {e}")
-        return
+        logger.error(f"Error occurred: {e}")
 
 
-async def get_image(filename):
+async def stream_image(filename: str, chunk_size: int = 64 * 1024) -> Optional[tuple[AsyncIterator[bytes], dict]]:
+    """Открывает объект и возвращает (итератор чанков, заголовки) или None, если объекта нет"""
     try:
-        response = minio_client.get_object(settings.MINIO_BUCKET, filename)
-        return response.read()
+        response = await _run(minio_client.get_object, settings.MINIO_BUCKET, filename)
     except S3Error as e:
-        print(f"Error occurred: {e}")
\ No newline at end of file
+        if e.code != 'NoSuchKey':
+            logger.error(f"Error occurred: {e}")
+        return None
+
+    headers = {
+        name: response.headers[name]
+        for name in ('Content-Type', 'Content-Length', 'ETag', 'Last-Modified')
+        if name in response.headers
+    }
+
+    async def chunks() -> AsyncIterator[bytes]:
+        try:
+            while chunk := await _run(response.read, chunk_size):
+                yield chunk
+        finally:
+            response.close()
+            response.release_conn()
+
+    return chunks(), headers
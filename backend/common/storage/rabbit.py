@@ -4,8 +4,13 @@ from aio_pika.pool import Pool
 import msgpack
 from aio_pika import ExchangeType
 import asyncio
+import json
+from uuid import uuid4
+from typing import Any, Awaitable, Callable, Dict
+from weakref import WeakKeyDictionary
 
 from common.core.config import settings
+from logger import logger
 
 
 async def get_connection() -> AbstractRobustConnection:
@@ -23,52 +28,227 @@ async def get_channel() -> aio_pika.Channel:
 channel_pool: Pool = Pool(get_channel, max_size=10)
 
 
-async def send_message(msg: str, queue_name: str, exchange_name: str, user_id: str, wait_answer: bool = False):
-    async with channel_pool.acquire() as channel:
+class Topology:
+    """Объявленные на канале exchange и привязки очередей, чтобы не объявлять их перед каждой публикацией"""
+
+    def __init__(self):
+        self.exchanges: dict[str, aio_pika.abc.AbstractExchange] = {}
+        self.bindings: set[tuple[str, str]] = set()
+
+    def clear(self, *_):
+        self.exchanges.clear()
+        self.bindings.clear()
+
+
+_topologies: WeakKeyDictionary = WeakKeyDictionary()
+
+
+def get_topology(channel: aio_pika.abc.AbstractChannel) -> Topology:
+    topology = _topologies.get(channel)
+    if topology is None:
+        topology = _topologies[channel] = Topology()
+        channel.close_callbacks.add(topology.clear)
+        # После переподключения robust-канала объявляем всё заново
+        if hasattr(channel, 'reopen_callbacks'):
+            channel.reopen_callbacks.add(topology.clear)
+    return topology
+
+
+async def declare_route(channel: aio_pika.abc.AbstractChannel, exchange_name: str, queue_name: str) -> aio_pika.abc.AbstractExchange:
+    topology = get_topology(channel)
+
+    exchange = topology.exchanges.get(exchange_name)
+    if exchange is None:
         exchange = await channel.declare_exchange(exchange_name, ExchangeType.DIRECT, durable=True)
+        topology.exchanges[exchange_name] = exchange
 
+    if (exchange_name, queue_name) not in topology.bindings:
         queue = await channel.declare_queue(queue_name, durable=True)
         await queue.bind(exchange, queue_name)
+        topology.bindings.add((exchange_name, queue_name))
+
+    return exchange
+
+
+async def declare_fanout(channel: aio_pika.abc.AbstractChannel, exchange_name: str) -> aio_pika.abc.AbstractExchange:
+    topology = get_topology(channel)
+
+    exchange = topology.exchanges.get(exchange_name)
+    if exchange is None:
+        exchange = await channel.declare_exchange(exchange_name, ExchangeType.FANOUT, durable=True)
+        topology.exchanges[exchange_name] = exchange
+    return exchange
+
+
+class RpcClient:
+    """
+    Request/reply поверх RabbitMQ: одна эксклюзивная очередь ответов на процесс,
+    ответы сопоставляются с запросами по correlation_id
+    """
+
+    def __init__(self):
+        self._channel: aio_pika.abc.AbstractChannel | None = None
+        self._queue: aio_pika.abc.AbstractQueue | None = None
+        self._futures: dict[str, asyncio.Future] = {}
+        self._lock = asyncio.Lock()
+
+    async def _start(self) -> aio_pika.abc.AbstractQueue:
+        async with self._lock:
+            if self._queue is None:
+                async with connection_pool.acquire() as connection:
+                    self._channel = await connection.channel()
+
+                # Имя задаём сами: robust-канал переобъявляет очередь после переподключения
+                self._queue = await self._channel.declare_queue(
+                    f'rpc.{uuid4().hex}', exclusive=True, auto_delete=True
+                )
+                await self._queue.consume(self._on_response, no_ack=True)
+        return self._queue
+
+    async def _on_response(self, message: aio_pika.abc.AbstractIncomingMessage):
+        future = self._futures.pop(message.correlation_id, None)
+        if future is not None and not future.done():
+            future.set_result(message.body)
+
+    async def call(self, msg, queue_name: str, exchange_name: str, timeout: float) -> bytes:
+        reply_queue = self._queue or await self._start()
+
+        correlation_id = str(uuid4())
+        future = asyncio.get_running_loop().create_future()
+        self._futures[correlation_id] = future
+
+        try:
+            await publish(msg, queue_name, exchange_name, correlation_id=correlation_id, reply_to=reply_queue.name)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._futures.pop(correlation_id, None)
+
+    async def close(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        if self._channel is not None:
+            await self._channel.close()
+        self._channel = self._queue = None
+
+
+rpc_client = RpcClient()
+
+
+async def publish(msg, queue_name: str, exchange_name: str, **properties):
+    async with channel_pool.acquire() as channel:
+        exchange = await declare_route(channel, exchange_name, queue_name)
 
         await exchange.publish(
             aio_pika.Message(
                 msgpack.packb(msg),
+                **properties,
             ),
             queue_name,
         )
 
-        if not wait_answer: return
 
-        user_queue_name = settings.USER_QUEUE.format(user_id=user_id)
-        user_queue = await channel.declare_queue(user_queue_name, durable=True)
+async def broadcast(msg, exchange_name: str):
+    """Рассылает сообщение всем процессам, подписанным на fanout-exchange"""
+    async with channel_pool.acquire() as channel:
+        exchange = await declare_fanout(channel, exchange_name)
+        await exchange.publish(aio_pika.Message(msgpack.packb(msg)), routing_key='')
 
-        await user_queue.bind(exchange, user_queue_name)
 
-        retries = 3
-        for _ in range(retries):
-            try:
-                answer = await user_queue.get()
-                info_json = answer.body.decode('utf-8')  # Декодируем байты в строку JSON
-                return info_json
-            except asyncio.QueueEmpty:
-                await asyncio.sleep(1)
+async def subscribe(exchange_name: str, handler: Callable[[Dict[str, Any]], Awaitable[None]]):
+    """Получает рассылки fanout-exchange'а в собственную временную очередь процесса"""
+    async with channel_pool.acquire() as channel:
+        exchange = await declare_fanout(channel, exchange_name)
+        queue = await channel.declare_queue(f'{exchange_name}.{uuid4().hex}', exclusive=True, auto_delete=True)
+        await queue.bind(exchange)
 
-        return {'error': 'unknown'}
+        async with queue.iterator(no_ack=True) as queue_iter:
+            async for message in queue_iter:
+                try:
+                    await handler(msgpack.unpackb(message.body))
+                except Exception:
+                    logger.exception(f'Failed to handle broadcast from {exchange_name}')
 
 
-async def send_answer(msg: str, exchange_name: str, user_id: str):
-    async with channel_pool.acquire() as channel:
-        exchange = await channel.declare_exchange(exchange_name, ExchangeType.DIRECT, durable=True)
+async def send_message(msg: str, queue_name: str, exchange_name: str, user_id: str, wait_answer: bool = False):
+    if not wait_answer:
+        await publish(msg, queue_name, exchange_name)
+        return
 
-        user_queue_name = settings.USER_QUEUE.format(user_id=user_id)
-        user_queue = await channel.declare_queue(user_queue_name, durable=True)
+    try:
+        answer = await rpc_client.call(msg, queue_name, exchange_name, settings.RPC_TIMEOUT)
+    except asyncio.TimeoutError:
+        return {'error': 'timeout'}
 
-        await user_queue.bind(
-            exchange,
-            user_queue_name,
-        )
+    return answer
 
-        await exchange.publish(
-            aio_pika.Message(body=msg),
-            routing_key=user_queue_name,
+
+async def send_answer(msg: bytes | dict, reply_to: str | None, correlation_id: str | None):
+    if not reply_to:
+        return
+
+    if not isinstance(msg, bytes):
+        msg = json.dumps(msg).encode('utf-8')
+
+    async with channel_pool.acquire() as channel:
+        await channel.default_exchange.publish(
+            aio_pika.Message(body=msg, correlation_id=correlation_id),
+            routing_key=reply_to,
         )
+
+
+async def consume(
+    queue_name: str,
+    handler: Callable[[Dict[str, Any]], Awaitable[None]],
+    concurrency: int = settings.CONSUMER_CONCURRENCY,
+    ordered: bool = settings.CONSUMER_ORDERED,
+):
+    """
+    Читает очередь и обрабатывает до concurrency сообщений одновременно.
+    Каждое сообщение подтверждается отдельно после своего обработчика.
+    При ordered сообщения одного user_id обрабатываются строго по очереди
+    """
+    async with channel_pool.acquire() as channel:
+        # prefetch совпадает с числом обработчиков: брокер не отдаст больше, чем мы успеваем
+        await channel.set_qos(prefetch_count=concurrency)
+        queue = await channel.declare_queue(queue_name, durable=True)
+
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks: set[asyncio.Task] = set()
+        tails: dict[str, asyncio.Task] = {}
+
+        async def process(message, body, previous):
+            try:
+                if previous is not None:
+                    await asyncio.wait({previous})
+                async with message.process():
+                    await handler(body)
+            except Exception:
+                logger.exception(f'Failed to handle message from {queue_name}')
+            finally:
+                semaphore.release()
+
+        def release_tail(key, task):
+            if tails.get(key) is task:
+                del tails[key]
+
+        try:
+            async with queue.iterator() as queue_iter:
+                async for message in queue_iter:
+                    await semaphore.acquire()
+
+                    body = msgpack.unpackb(message.body)
+                    body['reply_to'] = message.reply_to
+                    body['correlation_id'] = message.correlation_id
+
+                    key = body.get('user_id') if ordered else None
+                    task = asyncio.create_task(process(message, body, tails.get(key)))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+                    if key is not None:
+                        tails[key] = task
+                        task.add_done_callback(lambda t, key=key: release_tail(key, t))
+        finally:
+            if tasks:
+                await asyncio.wait(tasks)
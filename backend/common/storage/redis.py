@@ -1,7 +1,12 @@
+import asyncio
+import os
+import random
 import redis.asyncio as redis
 from common.core.config import settings
+from common.storage.ann import create_index
+from common.storage.vectors import dequantize_int8, normalize, pack_vector, quantize_int8, unpack_vector
 import numpy as np
-from typing import List, Tuple, Optional
+from typing import Awaitable, Callable, List, Tuple, Optional
 from logger import logger
 
 class RedisManager:
@@ -18,8 +23,151 @@ class RedisManager:
             )
         return cls._client
 
+# Удаляет первую ещё существующую комнату из списка и возвращает её номер и поля.
+# Скрипт выполняется атомарно, поэтому одну комнату может забрать только один клиент
+CLAIM_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    local data = redis.call('HGETALL', key)
+    if #data > 0 then
+        redis.call('DEL', key)
+        return {i, data}
+    end
+end
+return false
+"""
+
+
 class VectorStorage:
     PREFIX = "vector:"
+    # K - keyspace-канал, g - del, h - hset, x - expired, e - evicted
+    KEYSPACE_EVENTS = "Kghxe"
+    CLAIM_CANDIDATES = 16
+
+    QUANTIZED = settings.VECTOR_QUANTIZATION == 'int8'
+    # Квантованная погрешность может опустить подходящую комнату чуть ниже порога
+    QUANTIZATION_MARGIN = 0.02
+    # Корзины принимают int8-коды напрямую, IVF хранит float32
+    INDEX_CODES = QUANTIZED and settings.ROOM_INDEX_ENGINE == 'bucket'
+
+    index = create_index(
+        settings.ROOM_INDEX_ENGINE,
+        **({'nlist': settings.ROOM_INDEX_NLIST, 'nprobe': settings.ROOM_INDEX_NPROBE}
+           if settings.ROOM_INDEX_ENGINE == 'ivf' else {'quantized': QUANTIZED})
+    )
+    # Снимок нужен только IVF ради обученных кластеров: корзинам нечего сохранять,
+    # комнаты всё равно загружаются из Redis заново
+    SNAPSHOT = settings.ROOM_INDEX_SNAPSHOT if settings.ROOM_INDEX_ENGINE == 'ivf' else None
+    _sync_task: Optional[asyncio.Task] = None
+    _ready: Optional[asyncio.Event] = None
+    _claim_script = None
+
+    @classmethod
+    def _index_room(cls, data: dict):
+        room_id = data[b"room_id"].decode()
+        meta = (data[b"gender"].decode(), int(data[b"age"]), data[b"country"].decode())
+        if b"scale" not in data:
+            cls.index.add(room_id, unpack_vector(data[b"vector"]), *meta)
+            return
+
+        codes = np.frombuffer(data[b"vector"], dtype=np.int8)
+        if cls.INDEX_CODES:
+            # Коды из Redis попадают в индекс как есть: повторное квантование
+            # распакованного вектора дало бы другие коды
+            cls.index.add_codes(room_id, codes, float(data[b"scale"]), *meta)
+        else:
+            cls.index.add(room_id, dequantize_int8(codes, float(data[b"scale"])), *meta)
+
+    @classmethod
+    async def _load_room(cls, redis_client: redis.Redis, key: bytes):
+        data = await redis_client.hgetall(key)
+        room_id = key.decode()[len(cls.PREFIX):]
+        if not data:
+            cls.index.remove(room_id)
+            return
+        cls._index_room(data)
+
+    @classmethod
+    async def _check_keyspace_events(cls, redis_client: redis.Redis):
+        """
+        Флаги задаются при запуске Redis (--notify-keyspace-events в docker-compose).
+        Здесь только проверяем их и дописываем недостающие, не трогая чужие
+        """
+        try:
+            result = await redis_client.config_get("notify-keyspace-events")
+            current = next(iter(result.values()), b"")
+            current = current.decode() if isinstance(current, bytes) else current
+
+            # A - псевдоним для всех классов событий
+            enabled = set(current.replace("A", "g$lshzxetd"))
+            missing = "".join(flag for flag in cls.KEYSPACE_EVENTS if flag not in enabled)
+            if missing:
+                await redis_client.config_set("notify-keyspace-events", current + missing)
+                logger.warning(f"Enabled missing keyspace events '{missing}', configure them in Redis instead")
+        except redis.ResponseError as e:
+            # CONFIG может быть запрещён - тогда полагаемся на настройки развёртывания
+            logger.warning(f"Could not check notify-keyspace-events ({e}), Redis must run with '{cls.KEYSPACE_EVENTS}'")
+
+    @classmethod
+    async def _sync(cls):
+        """Держит индекс в актуальном состоянии по keyspace-уведомлениям Redis"""
+        redis_client = await RedisManager.get_redis()
+        await cls._check_keyspace_events(redis_client)
+
+        # Отдельное соединение без socket_timeout, иначе подписка отвалится на простое
+        pubsub_client = redis.Redis.from_url(settings.redis_url, decode_responses=False)
+        pubsub = pubsub_client.pubsub()
+        channel_prefix = f"__keyspace@{settings.REDIS_DB}__:"
+        await pubsub.psubscribe(f"{channel_prefix}{cls.PREFIX}*")
+
+        try:
+            # Подписываемся до первичной загрузки, чтобы не потерять изменения между ними
+            cls.index.clear()
+            async for key in redis_client.scan_iter(match=f"{cls.PREFIX}*", count=1000):
+                await cls._load_room(redis_client, key)
+            cls._ready.set()
+            logger.info(f"Room index loaded: {len(cls.index)} rooms")
+
+            async for message in pubsub.listen():
+                if message["type"] != "pmessage":
+                    continue
+                key = message["channel"][len(channel_prefix):]
+                event = message["data"]
+                if event == b"hset":
+                    await cls._load_room(redis_client, key)
+                elif event in (b"del", b"expired", b"evicted"):
+                    cls.index.remove(key.decode()[len(cls.PREFIX):])
+        finally:
+            await pubsub.aclose()
+            await pubsub_client.aclose()
+
+    @classmethod
+    async def start_sync(cls):
+        if cls._sync_task is None or cls._sync_task.done():
+            if cls._sync_task is None and cls.SNAPSHOT and os.path.exists(cls.SNAPSHOT):
+                # Снимок сохраняет обученные кластеры; сами комнаты всё равно перечитываются из Redis
+                cls.index.load(cls.SNAPSHOT)
+            cls._ready = asyncio.Event()
+            cls._sync_task = asyncio.create_task(cls._sync())
+
+        if not cls._ready.is_set():
+            waiter = asyncio.ensure_future(cls._ready.wait())
+            await asyncio.wait({waiter, cls._sync_task}, return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if cls._sync_task.done():
+                cls._sync_task.result()
+
+    @classmethod
+    async def stop_sync(cls):
+        if cls._sync_task is not None:
+            cls._sync_task.cancel()
+            try:
+                await cls._sync_task
+            except asyncio.CancelledError:
+                pass
+            cls._sync_task = None
+
+        if cls.SNAPSHOT:
+            cls.index.save(cls.SNAPSHOT)
 
     @staticmethod
     async def save_vector(
@@ -31,30 +179,87 @@ class VectorStorage:
     ):
         """Сохраняет вектор и метаданные в Redis Hash"""
         redis_client = await RedisManager.get_redis()
-        
-        await redis_client.hset(
-            f"{VectorStorage.PREFIX}{room_id}",
-            mapping={
-                "vector": vector.astype(np.float32).tobytes(),
-                "gender": gender,
-                "age": str(age),
-                "country": country,
-                "room_id": room_id
-            }
-        )
+
+        mapping = {
+            "vector": pack_vector(vector),
+            "gender": gender,
+            "age": str(age),
+            "country": country,
+            "room_id": room_id
+        }
+        if VectorStorage.QUANTIZED:
+            codes, scale = quantize_int8(unpack_vector(mapping["vector"]))
+            mapping["vector"] = codes.tobytes()
+            mapping["scale"] = repr(scale)
+
+        await redis_client.hset(f"{VectorStorage.PREFIX}{room_id}", mapping=mapping)
+        if VectorStorage.INDEX_CODES:
+            # Те же коды, что ушли в Redis и придут при загрузке по hset
+            VectorStorage.index.add_codes(room_id, codes, scale, gender, age, country)
+        else:
+            VectorStorage.index.add(room_id, vector, gender, age, country)
+
+    @staticmethod
+    async def restore_room(room_id: str, data: dict):
+        """Возвращает в ожидание комнату, забранную claim_room, с теми же полями"""
+        redis_client = await RedisManager.get_redis()
+        await redis_client.hset(f"{VectorStorage.PREFIX}{room_id}", mapping=data)
+        VectorStorage._index_room(data)
 
     @staticmethod
     async def delete_room(room_id: str):
         redis_client = await RedisManager.get_redis()
         await redis_client.delete(f"{VectorStorage.PREFIX}{room_id}")
+        VectorStorage.index.remove(room_id)
 
     @staticmethod
-    def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
-        """Вычисление косинусного сходства"""
-        dot_product = np.dot(a, b)
-        norm_a = np.linalg.norm(a)
-        norm_b = np.linalg.norm(b)
-        return (dot_product / (norm_a * norm_b)).item()
+    async def _ranked(
+        query_vector: np.ndarray,
+        top_k: int,
+        similarity_threshold: float,
+        gender: Optional[str],
+        age: Optional[int],
+        country: Optional[str]
+    ) -> List[Tuple[str, float]]:
+        """
+        Поиск по индексу. Для квантованного индекса берётся в RERANK_FACTOR раз
+        больше кандидатов, и они переранжируются по точным float32 векторам пользователей
+        """
+        if not VectorStorage.QUANTIZED:
+            return VectorStorage.index.search(
+                query_vector,
+                top_k=top_k,
+                similarity_threshold=similarity_threshold,
+                gender=gender,
+                age=age,
+                country=country
+            )
+
+        candidates = VectorStorage.index.search(
+            query_vector,
+            top_k=top_k * settings.RERANK_FACTOR,
+            similarity_threshold=similarity_threshold - VectorStorage.QUANTIZATION_MARGIN,
+            gender=gender,
+            age=age,
+            country=country
+        )
+        if not candidates:
+            return []
+
+        # id комнаты совпадает с id пользователя, точный вектор лежит в кэше векторов пользователей
+        from common.storage.vector_cache import user_vector_cache
+
+        vectors = await user_vector_cache.get_many([room_id for room_id, _ in candidates])
+        query = normalize(query_vector)
+
+        results = []
+        for room_id, score in candidates:
+            vector = vectors.get(room_id)
+            if vector is not None:
+                score = float(vector @ query)
+            if score >= similarity_threshold:
+                results.append((room_id, score))
+        return sorted(results, key=lambda item: -item[1])[:top_k]
 
     @staticmethod
     async def search_rooms(
@@ -64,47 +269,71 @@ class VectorStorage:
         gender: Optional[str] = None,
         age: Optional[int] = None,
         country: Optional[str] = None
-    ) -> List[Tuple[str, float, str, int, str]]:
+    ) -> List[str]:
         """
-        Возвращает отфильтрованные результаты:
-        (room_id, similarity, gender, age, country)
+        Возвращает id подходящих комнат, отсортированные по убыванию сходства.
+        Поиск идёт по локальному индексу без обращений к Redis
         """
+        await VectorStorage.start_sync()
+
+        results = await VectorStorage._ranked(query_vector, top_k, similarity_threshold, gender, age, country)
+        return [room_id for room_id, _ in results]
+
+    @staticmethod
+    async def claim_room(
+        query_vector: np.ndarray,
+        is_alive: Callable[[str], Awaitable[bool]],
+        top_k: int = 3,
+        similarity_threshold: float = 0.6,
+        gender: Optional[str] = None,
+        age: Optional[int] = None,
+        country: Optional[str] = None
+    ) -> Optional[Tuple[str, dict]]:
+        """
+        Находит и атомарно забирает подходящую комнату.
+        Комнату получает ровно один клиент; устаревшие комнаты
+        удаляются по пути и пропускаются.
+        Вместе с id возвращаются поля комнаты из Redis для restore_room
+        """
+        await VectorStorage.start_sync()
+
+        results = await VectorStorage._ranked(
+            query_vector, max(top_k, VectorStorage.CLAIM_CANDIDATES), similarity_threshold, gender, age, country
+        )
+        room_ids = [room_id for room_id, _ in results]
+
+        # Среди лучших top_k порядок случайный, чтобы одновременные клиенты не бились за одну комнату
+        best = room_ids[:top_k]
+        random.shuffle(best)
+        room_ids[:top_k] = best
+
         redis_client = await RedisManager.get_redis()
-        
-        keys = await redis_client.keys(f"{VectorStorage.PREFIX}*")
-        results = []
-        query = query_vector.astype(np.float32).flatten()
-        
-        for key in keys:
-            data = await redis_client.hgetall(key)
-
-            vector = np.frombuffer(data[b"vector"], dtype=np.float32)
-            room_gender = data[b"gender"].decode()
-            room_age = int(data[b"age"])
-            room_country = data[b"country"].decode()
-            room_id = data[b"room_id"].decode()
-
-            # Фильтрация
-            if gender is not None and room_gender != gender:
-                continue
-                
-            if age is not None and abs(room_age - age) > 2:
-                continue
-                
-            if country is not None and room_country != country:
-                continue
-                
-            # Вычисление сходства
-            similarity = VectorStorage.cosine_similarity(query, vector)
-            
-            if similarity >= similarity_threshold:
-                results.append((
-                    room_id,
-                    similarity,
-                    room_gender,
-                    room_age,
-                    room_country
-                ))
-        
-        # Сортировка и ограничение результатов
-        return [i[0] for i in sorted(results, key=lambda x: -x[1])[:top_k]]
+        if VectorStorage._claim_script is None:
+            VectorStorage._claim_script = redis_client.register_script(CLAIM_SCRIPT)
+
+        while room_ids:
+            result = await VectorStorage._claim_script(
+                keys=[f"{VectorStorage.PREFIX}{room_id}" for room_id in room_ids]
+            )
+            claimed = result[0] if result else None
+
+            # Комнаты до забранной уже удалены кем-то другим
+            taken = room_ids[:claimed] if claimed else room_ids
+            room_ids = room_ids[len(taken):]
+            for room_id in taken:
+                VectorStorage.index.remove(room_id)
+
+            if not claimed:
+                return None
+
+            room_id = taken[-1]
+            if await is_alive(room_id):
+                fields = result[1]
+                return room_id, dict(zip(fields[::2], fields[1::2]))
+            logger.info(f"Skipped stale room {room_id}")
+
+        return None
+
+    @staticmethod
+    def stats() -> dict:
+        return VectorStorage.index.stats()
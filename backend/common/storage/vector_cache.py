@@ -0,0 +1,101 @@
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from common.core.config import settings
+from common.storage.cache import LRUCache
+from common.storage.redis import RedisManager
+from common.storage.vectors import pack_vector, unpack_vector
+
+
+class UserVectorCache:
+    """
+    Read-through кэш векторов пользователей перед ClickHouse:
+    короткоживущий LRU в памяти процесса и общий уровень в Redis
+    """
+    PREFIX = 'uservec:'
+
+    def __init__(
+        self,
+        maxsize: int = settings.USER_VECTOR_CACHE_SIZE,
+        local_ttl: float = settings.USER_VECTOR_LOCAL_TTL,
+        redis_ttl: int = settings.USER_VECTOR_TTL
+    ):
+        self.local = LRUCache(maxsize, ttl=local_ttl)
+        self.redis_ttl = redis_ttl
+
+        self.redis_hits = 0
+        self.misses = 0
+
+    async def get(self, user_id: str) -> Optional[np.ndarray]:
+        vector = self.local.get(user_id)
+        if vector is not None:
+            return vector
+
+        redis_client = await RedisManager.get_redis()
+        data = await redis_client.get(f'{self.PREFIX}{user_id}')
+        if data is None:
+            return None
+
+        self.redis_hits += 1
+        vector = unpack_vector(data)
+        self.local.set(user_id, vector)
+        return vector
+
+    async def get_many(self, user_ids: list[str]) -> dict[str, np.ndarray]:
+        """Векторы из кэша одним MGET для всех, кого нет в памяти процесса; без загрузки из ClickHouse"""
+        found = {}
+        missing = []
+        for user_id in user_ids:
+            vector = self.local.get(user_id)
+            if vector is not None:
+                found[user_id] = vector
+            else:
+                missing.append(user_id)
+
+        if missing:
+            redis_client = await RedisManager.get_redis()
+            values = await redis_client.mget([f'{self.PREFIX}{user_id}' for user_id in missing])
+            for user_id, data in zip(missing, values):
+                if data is not None:
+                    self.redis_hits += 1
+                    found[user_id] = unpack_vector(data)
+                    self.local.set(user_id, found[user_id])
+        return found
+
+    async def get_or_load(self, user_id: str, loader: Callable[[str], Awaitable[Optional[np.ndarray]]]) -> Optional[np.ndarray]:
+        vector = await self.get(user_id)
+        if vector is not None:
+            return vector
+
+        self.misses += 1
+        loaded = await loader(user_id)
+        if loaded is None:
+            return None
+
+        return await self.set(user_id, loaded)
+
+    async def set(self, user_id: str, vector) -> np.ndarray:
+        data = pack_vector(vector)
+        vector = unpack_vector(data)
+        self.local.set(user_id, vector)
+
+        redis_client = await RedisManager.get_redis()
+        await redis_client.set(f'{self.PREFIX}{user_id}', data, ex=self.redis_ttl)
+        return vector
+
+    async def invalidate(self, user_id: str) -> None:
+        self.local.delete(user_id)
+
+        redis_client = await RedisManager.get_redis()
+        await redis_client.delete(f'{self.PREFIX}{user_id}')
+
+    def stats(self) -> dict:
+        return {
+            'local': self.local.stats(),
+            'redis_hits': self.redis_hits,
+            'misses': self.misses,
+        }
+
+
+user_vector_cache = UserVectorCache()
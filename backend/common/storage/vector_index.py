@@ -0,0 +1,237 @@
+import numpy as np
+from typing import Iterator, List, Optional, Tuple
+
+from common.storage.vectors import dequantize_int8, normalize, quantize_int8
+
+
+AGE_WINDOW = 2
+# Строк int8 на один перевод во float32 при поиске: буфер остаётся в кэше процессора
+SCORE_BLOCK = 1024
+
+
+class Bucket:
+    """
+    Комнаты с одинаковыми (пол, страна, возраст) в одной плотной матрице:
+    float32 или int8-коды с масштабом на строку при quantized
+    """
+
+    def __init__(self, dim: int, capacity: int = 64, quantized: bool = False):
+        self.quantized = quantized
+        self.vectors = np.zeros((capacity, dim), dtype=np.int8 if quantized else np.float32)
+        self.scales = np.ones(capacity, dtype=np.float32) if quantized else None
+        self.room_ids: List[str] = []
+        self.rows: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.room_ids)
+
+    def _row(self, room_id: str) -> int:
+        row = self.rows.get(room_id)
+        if row is None:
+            row = len(self.room_ids)
+            if row == self.vectors.shape[0]:
+                vectors = np.zeros((row * 2, self.vectors.shape[1]), dtype=self.vectors.dtype)
+                vectors[:row] = self.vectors
+                self.vectors = vectors
+                if self.quantized:
+                    self.scales = np.resize(self.scales, row * 2)
+            self.rows[room_id] = row
+            self.room_ids.append(room_id)
+        return row
+
+    def add(self, room_id: str, vector: np.ndarray):
+        row = self._row(room_id)
+        if self.quantized:
+            self.vectors[row], self.scales[row] = quantize_int8(vector)
+        else:
+            self.vectors[row] = vector
+
+    def add_codes(self, room_id: str, codes: np.ndarray, scale: float):
+        """Готовые int8-коды, например из Redis, кладутся без повторного квантования"""
+        row = self._row(room_id)
+        self.vectors[row], self.scales[row] = codes, scale
+
+    def remove(self, room_id: str):
+        row = self.rows.pop(room_id)
+
+        # Последнюю строку переносим на место удалённой, чтобы матрица оставалась плотной
+        last = len(self.room_ids) - 1
+        last_id = self.room_ids.pop()
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            if self.quantized:
+                self.scales[row] = self.scales[last]
+            self.room_ids[row] = last_id
+            self.rows[last_id] = row
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        n = len(self.room_ids)
+        if not self.quantized:
+            return self.vectors[:n] @ query
+
+        # int8 переводится во float32 блоками через один буфер, а не копией всей корзины.
+        # По скорости это примерно как float32, выигрыш квантования - только память
+        scores = np.empty(n, dtype=np.float32)
+        block = np.empty((min(n, SCORE_BLOCK), self.vectors.shape[1]), dtype=np.float32)
+        for start in range(0, n, SCORE_BLOCK):
+            end = min(start + SCORE_BLOCK, n)
+            block[:end - start] = self.vectors[start:end]
+            np.matmul(block[:end - start], query, out=scores[start:end])
+        scores *= self.scales[:n]
+        return scores
+
+
+class RoomIndex:
+    """
+    Индекс ожидающих комнат в памяти процесса.
+    Комнаты разложены по корзинам gender -> country -> age,
+    поиск проходит только по корзинам, подходящим под фильтры.
+    При quantized векторы хранятся как int8, и оценки сходства приближённые
+    """
+
+    def __init__(self, quantized: bool = False):
+        self.quantized = quantized
+        self._buckets: dict[Optional[str], dict[Optional[str], dict[int, Bucket]]] = {}
+        self._keys: dict[str, Tuple[Optional[str], Optional[str], int]] = {}
+        self._dim: Optional[int] = None
+
+        self.queries = 0
+        self.scanned = 0
+        self.last_scanned = 0
+        self.last_buckets = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, room_id: str) -> bool:
+        return room_id in self._keys
+
+    def _bucket(self, room_id: str, dim: int, gender: Optional[str], age: int, country: Optional[str]) -> Bucket:
+        if self._dim is None:
+            self._dim = dim
+
+        key = (gender, country, int(age))
+        if self._keys.get(room_id) != key:
+            self.remove(room_id)
+            self._keys[room_id] = key
+
+        bucket = self._buckets.setdefault(gender, {}).setdefault(country, {}).get(key[2])
+        if bucket is None:
+            bucket = self._buckets[gender][country][key[2]] = Bucket(self._dim, quantized=self.quantized)
+        return bucket
+
+    def add(self, room_id: str, vector: np.ndarray, gender: Optional[str], age: int, country: Optional[str]):
+        vector = normalize(vector)
+        self._bucket(room_id, vector.shape[0], gender, age, country).add(room_id, vector)
+
+    def add_codes(
+        self,
+        room_id: str,
+        codes: np.ndarray,
+        scale: float,
+        gender: Optional[str],
+        age: int,
+        country: Optional[str]
+    ):
+        """Добавляет комнату по int8-кодам из quantize_int8; индекс без quantized их распаковывает"""
+        if not self.quantized:
+            self.add(room_id, dequantize_int8(codes, scale), gender, age, country)
+            return
+        self._bucket(room_id, codes.shape[0], gender, age, country).add_codes(room_id, codes, scale)
+
+    def remove(self, room_id: str):
+        key = self._keys.pop(room_id, None)
+        if key is None:
+            return
+
+        gender, country, age = key
+        countries = self._buckets[gender]
+        ages = countries[country]
+        bucket = ages[age]
+        bucket.remove(room_id)
+
+        if not bucket:
+            del ages[age]
+            if not ages:
+                del countries[country]
+                if not countries:
+                    del self._buckets[gender]
+
+    def clear(self):
+        self._buckets.clear()
+        self._keys.clear()
+
+    @staticmethod
+    def _level(level: dict, value) -> Iterator:
+        if value is None:
+            yield from level.values()
+        elif value in level:
+            yield level[value]
+
+    def _candidate_buckets(
+        self,
+        gender: Optional[str],
+        age: Optional[int],
+        country: Optional[str]
+    ) -> Iterator[Bucket]:
+        for countries in self._level(self._buckets, gender):
+            for ages in self._level(countries, country):
+                if age is None:
+                    yield from ages.values()
+                    continue
+                # Окно |room_age - age| <= 2 - это ровно 5 соседних возрастных корзин
+                for room_age in range(age - AGE_WINDOW, age + AGE_WINDOW + 1):
+                    if room_age in ages:
+                        yield ages[room_age]
+
+    def search(
+        self,
+        query_vector: np.ndarray,
+        top_k: int = 3,
+        similarity_threshold: float = 0.6,
+        gender: Optional[str] = None,
+        age: Optional[int] = None,
+        country: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """Возвращает до top_k пар (room_id, similarity), отсортированных по убыванию сходства"""
+        buckets = list(self._candidate_buckets(gender, age, country))
+
+        self.queries += 1
+        self.last_buckets = len(buckets)
+        self.last_scanned = sum(len(bucket) for bucket in buckets)
+        self.scanned += self.last_scanned
+
+        if not self.last_scanned:
+            return []
+
+        query = normalize(query_vector)
+        scores = np.concatenate([bucket.scores(query) for bucket in buckets])
+        offsets = np.cumsum([len(bucket) for bucket in buckets])
+
+        candidates = np.flatnonzero(scores >= similarity_threshold)
+        if candidates.size == 0:
+            return []
+
+        if candidates.size > top_k:
+            best = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+            candidates = candidates[best]
+        candidates = candidates[np.argsort(-scores[candidates])]
+
+        results = []
+        for i in candidates:
+            b = int(np.searchsorted(offsets, i, side="right"))
+            row = i - (offsets[b - 1] if b else 0)
+            results.append((buckets[b].room_ids[row], float(scores[i])))
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "engine": "bucket",
+            "quantized": self.quantized,
+            "rooms": len(self._keys),
+            "buckets": sum(len(ages) for countries in self._buckets.values() for ages in countries.values()),
+            "queries": self.queries,
+            "last_scanned": self.last_scanned,
+            "last_buckets": self.last_buckets,
+            "avg_scanned": self.scanned / self.queries if self.queries else 0.0,
+        }
@@ -0,0 +1,35 @@
+import numpy as np
+
+
+# Формат вектора на проводе и в хранилищах: нормированные float32 little-endian байты подряд.
+# Векторы хранятся уже нормированными, поэтому косинусное сходство - это просто скалярное произведение
+VECTOR_DTYPE = np.dtype('<f4')
+
+
+def normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return vector
+    return vector / norm
+
+
+def pack_vector(vector) -> bytes:
+    return normalize(vector).astype(VECTOR_DTYPE, copy=False).tobytes()
+
+
+def unpack_vector(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=VECTOR_DTYPE)
+
+
+def quantize_int8(vector) -> tuple[np.ndarray, float]:
+    """Скалярное квантование в int8 с отдельным масштабом на вектор"""
+    vector = np.asarray(vector, dtype=np.float32)
+    scale = float(np.abs(vector).max()) / 127
+    if scale == 0:
+        return np.zeros(vector.shape, dtype=np.int8), 1.0
+    return np.round(vector / scale).astype(np.int8), scale
+
+
+def dequantize_int8(codes: np.ndarray, scale: float) -> np.ndarray:
+    return codes.astype(np.float32) * np.float32(scale)
@@ -0,0 +1,92 @@
+import hashlib
+import unicodedata
+from typing import Awaitable, Callable
+
+import numpy as np
+from redis.exceptions import RedisError
+
+from common.core.config import settings
+from common.storage.cache import LRUCache
+from common.storage.redis import RedisManager
+from common.storage.vectors import pack_vector, unpack_vector
+from logger import logger
+
+
+def text_key(text: str) -> str:
+    """Хэш нормализованного текста: одинаковые описания дают один ключ"""
+    text = ' '.join(unicodedata.normalize('NFC', text).split())
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Кэш эмбеддингов по содержимому описания:
+    LRU в памяти процесса и необязательный общий уровень в Redis.
+    Ошибки Redis не мешают обработке: кэш тогда работает только в памяти
+    """
+    PREFIX = 'emb:'
+
+    def __init__(
+        self,
+        maxsize: int = settings.EMBEDDING_CACHE_SIZE,
+        use_redis: bool = settings.EMBEDDING_CACHE_REDIS,
+        redis_ttl: int = settings.EMBEDDING_CACHE_TTL
+    ):
+        self.local = LRUCache(maxsize)
+        self.use_redis = use_redis
+        self.redis_ttl = redis_ttl
+
+        self.redis_hits = 0
+        self.redis_errors = 0
+        self.misses = 0
+
+    async def get_or_compute(self, text: str, compute: Callable[[str], Awaitable[np.ndarray]]) -> np.ndarray:
+        key = text_key(text)
+
+        vector = self.local.get(key)
+        if vector is not None:
+            return vector
+
+        if self.use_redis:
+            data = await self._redis_get(key)
+            if data is not None:
+                self.redis_hits += 1
+                vector = unpack_vector(data)
+                self.local.set(key, vector)
+                return vector
+
+        self.misses += 1
+        vector = await compute(text)
+        self.local.set(key, vector)
+
+        if self.use_redis:
+            await self._redis_set(key, vector)
+        return vector
+
+    async def _redis_get(self, key: str) -> bytes | None:
+        try:
+            redis_client = await RedisManager.get_redis()
+            return await redis_client.get(f'{self.PREFIX}{key}')
+        except RedisError as e:
+            self.redis_errors += 1
+            logger.warning(f'Embedding cache read from Redis failed: {e}')
+            return None
+
+    async def _redis_set(self, key: str, vector: np.ndarray):
+        try:
+            redis_client = await RedisManager.get_redis()
+            await redis_client.set(f'{self.PREFIX}{key}', pack_vector(vector), ex=self.redis_ttl)
+        except RedisError as e:
+            self.redis_errors += 1
+            logger.warning(f'Embedding cache write to Redis failed: {e}')
+
+    def stats(self) -> dict:
+        return {
+            'local': self.local.stats(),
+            'redis_hits': self.redis_hits,
+            'redis_errors': self.redis_errors,
+            'misses': self.misses,
+        }
+
+
+embedding_cache = EmbeddingCache()
@@ -1,6 +1,6 @@
 from typing import Any, Dict
 
-from handlers.handle_event_model import handle_event_generate_vector, handle_event_get_best, handle_event_get_vector, handle_event_update_vector
+from handlers.handle_event_model import handle_event_generate_vector, handle_event_get_best, handle_event_get_stats, handle_event_get_vector, handle_event_update_vector
 
 
 async def handle_event_distribution(body: Dict[str, Any]) -> None:
@@ -17,3 +17,6 @@ async def handle_event_distribution(body: Dict[str, Any]) -> None:
         case 'get_best':
             await handle_event_get_best(body)
             return
+        case 'get_stats':
+            await handle_event_get_stats(body)
+            return
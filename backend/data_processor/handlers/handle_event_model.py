@@ -1,50 +1,61 @@
 from typing import Any, Dict
 
 from common.storage.rabbit import send_answer
-from common.storage.clickhouse import ClickHouseAsyncClient
+from common.storage.clickhouse import clickhouse
+from common.storage.vectors import pack_vector
+from common.storage.vector_cache import user_vector_cache
 from vectorizer import model
-import json
+from embedding_cache import embedding_cache
 
 
 async def handle_event_generate_vector(body: Dict[str, Any]) -> None:
 
     user_id = body.get('user_id')
 
-    vector = model.generate_embedding(str(body.get('description')))
+    vector = await embedding_cache.get_or_compute(str(body.get('description')), model.embed)
 
-    async with ClickHouseAsyncClient() as client:
-        await client.insert_vector({'userid': user_id, 'vector': vector})
+    await clickhouse.insert_vector({'userid': user_id, 'vector': vector})
+
+    await user_vector_cache.set(user_id, vector)
 
 
 async def handle_event_update_vector(body: Dict[str, Any]) -> None:
 
     user_id = body.get('user_id')
 
-    vector = model.generate_embedding(str(body.get('description')))
+    vector = await embedding_cache.get_or_compute(str(body.get('description')), model.embed)
+
+    await clickhouse.update_vector(user_id, vector)
 
-    async with ClickHouseAsyncClient() as client:
-        await client.update_vector(user_id, vector)
+    await user_vector_cache.set(user_id, vector)
 
 
 async def handle_event_get_best(body: Dict[str, Any]) -> None:
 
     user_id = body.get('user_id')
 
-    async with ClickHouseAsyncClient() as client:
-
-        neighbor = await client.get_neighbor(user_id, threshold=0.5)
+    neighbors = await clickhouse.get_neighbor(user_id, threshold=0.5, top_k=body.get('top_k', 5))
 
-    await send_answer(neighbor if neighbor else {}, "users", user_id)
+    await send_answer({'neighbors': neighbors}, body.get('reply_to'), body.get('correlation_id'))
 
 
 async def handle_event_get_vector(body: Dict[str, Any]) -> None:
 
-    user_id = body.get('user_id')
     target_user_id = body.get('target_user_id')
 
-    async with ClickHouseAsyncClient() as client:
+    vector = await user_vector_cache.get_or_load(target_user_id, clickhouse.get_vector_by_userid)
+
+    # Ответ - сырые float32 байты нормированного вектора, пустое тело если вектора нет
+    answer = pack_vector(vector) if vector is not None else b''
+    await send_answer(answer, body.get('reply_to'), body.get('correlation_id'))
+
 
-        vector = await client.get_vector_by_userid(target_user_id)
+async def handle_event_get_stats(body: Dict[str, Any]) -> None:
 
-    vector = json.dumps(vector, ensure_ascii=False).encode('utf-8')
-    await send_answer(vector if vector else {}, "users", user_id)
+    stats = {
+        'vectorizer': model.stats(),
+        'embedding_cache': embedding_cache.stats(),
+        'user_vectors': user_vector_cache.stats(),
+        'clickhouse': clickhouse.stats(),
+    }
+    await send_answer(stats, body.get('reply_to'), body.get('correlation_id'))
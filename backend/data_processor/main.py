@@ -1,30 +1,27 @@
-import msgpack
 import asyncio
+import signal
 from common.core.config import settings
 from handlers.event_distribution import handle_event_distribution
 from common.storage import rabbit
+from common.storage.clickhouse import clickhouse
 from logger import logger
 
 
 async def message_handler(loop):
-    queue_name = settings.MODEL_QUEUE
-    async with rabbit.channel_pool.acquire() as channel:
-
-        await channel.set_qos(prefetch_count=10)
-        queue = await channel.declare_queue(queue_name, durable=True)
-
-        logger.info('Started, rabbit connected')
-
-        async with queue.iterator() as queue_iter:
-            async for message in queue_iter:
-                async with message.process():
-                    body = msgpack.unpackb(message.body)
-                    await handle_event_distribution(body)
+    logger.info(f'Started, consuming {settings.MODEL_QUEUE}')
+    await rabbit.consume(settings.MODEL_QUEUE, handle_event_distribution)
 
 
 async def main():
     loop = asyncio.get_event_loop()
-    await message_handler(loop)
+    # По SIGTERM завершаемся штатно, чтобы дописать буфер векторов в ClickHouse
+    loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+    await clickhouse.start()
+    try:
+        await message_handler(loop)
+    finally:
+        await clickhouse.close()
 
 
 if __name__ == "__main__":
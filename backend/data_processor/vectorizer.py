@@ -1,14 +1,87 @@
+import asyncio
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from sentence_transformers import SentenceTransformer
 
+from common.core.config import settings
+from common.core.metrics import Histogram
+
 
 class Vectorizer:
-    def __init__(self):
+    def __init__(
+        self,
+        max_batch: int = settings.EMBEDDING_BATCH_SIZE,
+        max_delay_ms: float = settings.EMBEDDING_BATCH_DELAY_MS
+    ):
         self.model = SentenceTransformer('./models/rubert-tiny2')
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+
+        # Модель работает в отдельном потоке, чтобы не блокировать event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vectorizer')
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+
+        self.batch_sizes = Histogram((1, 2, 4, 8, 16, 32, 64))
+        self.latency_ms = Histogram((5, 10, 25, 50, 100, 250, 500, 1000))
 
     def generate_embedding(self, description: str) -> list[float]:
         embs = self.model.encode(description).tolist()
         return embs
 
+    async def embed(self, description: str) -> np.ndarray:
+        """Ставит описание в очередь на пакетное кодирование и ждёт свой вектор"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._batcher())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((description, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> list[tuple]:
+        """Собирает до max_batch описаний или ждёт не дольше max_delay после первого"""
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_delay
+
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            descriptions = [description for description, _, _ in batch]
+
+            try:
+                embs = await loop.run_in_executor(self._executor, self.model.encode, descriptions)
+            except Exception as exc:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+
+            self.batch_sizes.observe(len(batch))
+            done = time.perf_counter()
+            for (_, future, started), emb in zip(batch, embs):
+                self.latency_ms.observe((done - started) * 1000)
+                if not future.done():
+                    future.set_result(emb.astype(np.float32, copy=False))
+
+    def stats(self) -> dict:
+        return {
+            'batch_size': self.batch_sizes.snapshot(),
+            'latency_ms': self.latency_ms.snapshot(),
+        }
+
 model = Vectorizer()
 
 if __name__ == "__main__":
@@ -3,14 +3,14 @@ from typing import Any, Dict
 from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from common.storage.database import async_session
-from common.storage.rabbit import send_answer
+from common.core.config import settings
+from common.storage.rabbit import broadcast, send_answer
 from common.storage.models.hobby import Hobby
 from common.schemas.hobbies import HobbyList, HobbySchema
 
 
 async def handle_event_hobbies(body: Dict[str, Any]) -> None:
 
-    user_id = body.get('user_id')
     async with async_session() as db:
 
         result = await db.execute(select(Hobby))
@@ -20,11 +20,10 @@ async def handle_event_hobbies(body: Dict[str, Any]) -> None:
 
     serialized_data = hobby_list.model_dump_json().encode('utf-8')
 
-    await send_answer(serialized_data, "hobbies", user_id)
+    await send_answer(serialized_data, body.get('reply_to'), body.get('correlation_id'))
 
 
 async def handle_event_hobby(body: Dict[str, Any]) -> None:
-    user_id = body.get('user_id')
 
     async with async_session() as db:
 
@@ -41,6 +40,9 @@ async def handle_event_hobby(body: Dict[str, Any]) -> None:
             await db.rollback()
         
     if success:
+        # Каталог изменился - API сбросят свои кэши
+        await broadcast({'action': 'hobbies_changed'}, settings.HOBBIES_EXCHANGE)
+
         hobby = HobbySchema.model_validate(new_hobby.__dict__)
         serialized_data = hobby.model_dump_json().encode('utf-8')
-        await send_answer(serialized_data, "hobbies", user_id)
+        await send_answer(serialized_data, body.get('reply_to'), body.get('correlation_id'))
@@ -1,16 +1,19 @@
 from typing import Any, Dict
 
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.exc import IntegrityError
-from common.storage.database import async_session
+from common.storage.database import async_session, engine
 from common.storage.rabbit import send_answer
 from common.storage.models.user import User
 from common.schemas.user import UserRegister, UserLogin, UserInfo
 
 
-async def handle_event_create_user(body: Dict[str, Any]) -> None:
+# Горячие запросы идут через Core и выбирают только поля нужной схемы, без ORM-объектов
+USER_LOGIN_COLUMNS = (User.id, User.username, User.password)
+USER_INFO_COLUMNS = (User.username, User.is_male, User.birthdate, User.country, User.description)
 
-    user_id = body.get('user_id')
+
+async def handle_event_create_user(body: Dict[str, Any]) -> None:
 
     async with async_session() as db:
 
@@ -29,60 +32,52 @@ async def handle_event_create_user(body: Dict[str, Any]) -> None:
     if success:
         new_user = UserLogin.model_validate(new_user.__dict__)
         serialized_data = new_user.model_dump_json().encode('utf-8')
-        await send_answer(serialized_data, "users", user_id)
+        await send_answer(serialized_data, body.get('reply_to'), body.get('correlation_id'))
 
 
 async def handle_event_get_user(body: Dict[str, Any]) -> None:
 
-    user_id = body.get('user_id')
-
     username = body.get('username')
-    async with async_session() as db:
-        result = await db.execute(select(User).where(User.username == username))
-        user = result.scalars().first()
-    
+    async with engine.connect() as conn:
+        result = await conn.execute(select(*USER_LOGIN_COLUMNS).where(User.username == username))
+        row = result.first()
+
     serialized_data = {}
-    if user:
-        user = UserLogin.model_validate(user.__dict__)
-        serialized_data = user.model_dump_json().encode('utf-8')
-    await send_answer(serialized_data, "users", user_id)
+    if row:
+        serialized_data = UserLogin.model_validate(dict(row._mapping)).model_dump_json().encode('utf-8')
+    await send_answer(serialized_data, body.get('reply_to'), body.get('correlation_id'))
 
 
 async def handle_event_get_user_info(body: Dict[str, Any]) -> None:
 
     user_id = body.get('user_id')
 
-    async with async_session() as db:
-        result = await db.execute(select(User).where(User.id == user_id))
-        user = result.scalars().first()
+    async with engine.connect() as conn:
+        result = await conn.execute(select(*USER_INFO_COLUMNS).where(User.id == user_id))
+        row = result.first()
 
     serialized_data = {}
-    if user:
-        user = UserInfo.model_validate(user.__dict__)
-        serialized_data = user.model_dump_json().encode('utf-8')
-    await send_answer(serialized_data, "users", user_id)
+    if row:
+        serialized_data = UserInfo.model_validate(dict(row._mapping)).model_dump_json().encode('utf-8')
+    await send_answer(serialized_data, body.get('reply_to'), body.get('correlation_id'))
 
 
 async def handle_event_set_user_info(body: Dict[str, Any]) -> None:
     user_id = body.get('user_id')
 
-    async with async_session() as db:
-        result = await db.execute(select(User).where(User.id == user_id))
-        user = result.scalars().first()
-
-        if not user:
-            return
-        
-        new_info = UserInfo.model_validate(body.get('new_info'))
-
-        # Обновляем только указанные поля
-        for key, value in new_info.model_dump(exclude_unset=True).items():
-            setattr(user, key, value)
+    new_info = UserInfo.model_validate(body.get('new_info'))
+    # Обновляем только указанные поля
+    values = new_info.model_dump(exclude_unset=True)
 
-        # Фиксируем изменения в базе данных
-        await db.commit()
+    async with engine.begin() as conn:
+        if values:
+            query = update(User).where(User.id == user_id).values(**values).returning(*USER_INFO_COLUMNS)
+        else:
+            query = select(*USER_INFO_COLUMNS).where(User.id == user_id)
+        row = (await conn.execute(query)).first()
 
-    user = UserInfo.model_validate(user.__dict__)
-    serialized_data = user.model_dump_json().encode('utf-8')
-    await send_answer(serialized_data, "users", user_id)
+    if not row:
+        return
 
+    serialized_data = UserInfo.model_validate(dict(row._mapping)).model_dump_json().encode('utf-8')
+    await send_answer(serialized_data, body.get('reply_to'), body.get('correlation_id'))
@@ -5,6 +5,7 @@ from typing import AsyncGenerator
 from fastapi import FastAPI
 
 from lifespan import main
+from common.storage.database import engine
 
 
 @asynccontextmanager
@@ -21,6 +22,8 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
         except asyncio.CancelledError:
             pass
 
+    await engine.dispose()
+
 
 def create_app() -> FastAPI:
     app = FastAPI(docs_url='/swagger', lifespan=lifespan)